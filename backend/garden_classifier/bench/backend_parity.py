@@ -0,0 +1,95 @@
+# backend_parity.py
+# checks that an exported inference backend (onnx / openvino / int8) detects the same things as the .pt
+# weights. every photo of a folder goes through both runtimes and the boxes above --min-conf are matched
+# class by class - a box counts as found when the other runtime has a box of the same class with
+# iou >= --box-iou and a confidence within --conf-tol. the species model is compared on the plant crops.
+# the exit code is 1 when the match rate of either model drops below --min-match.
+#
+# usage:
+#   python bench/backend_parity.py --images ../uploads/photos --backend onnx
+
+import argparse, os, sys
+
+# the reference must be the .pt weights whatever the server is configured with
+os.environ["INFERENCE_BACKEND"] = "torch"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import image_extracter as IE
+import inference_backend as IB
+from eval_container_policy import load_images
+
+# share of the reference boxes found by the candidate, plus the largest confidence difference seen
+def match_boxes(ref, cand, box_iou, conf_tol):
+    (rb, rc, rf), (cb, cc, cf) = ref, cand
+    found, worst = 0, 0.0
+    for c in np.unique(rc):
+        ri, ci = np.flatnonzero(rc == c), np.flatnonzero(cc == c)
+        if len(ci) == 0:
+            continue
+        m = IE.iou_matrix(rb[ri], cb[ci])
+        used = set()
+        for r in np.argsort(-rf[ri]):
+            order = [j for j in np.argsort(-m[r]) if j not in used]
+            if not order or m[r, order[0]] < box_iou:
+                continue
+            j = order[0]
+            diff = abs(float(rf[ri[r]]) - float(cf[ci[j]]))
+            worst = max(worst, diff)
+            if diff <= conf_tol:
+                found += 1
+                used.add(j)
+    return found, len(rb), worst
+
+def above(res, min_conf):
+    xyxy, cls, conf = IE.boxes_as_arrays(res)
+    keep = conf >= min_conf
+    return xyxy[keep], cls[keep], conf[keep]
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare an exported backend with the .pt weights")
+    ap.add_argument("--images", required=True)
+    ap.add_argument("--backend", choices=[b for b in IB.BACKENDS if b != "torch"], default="onnx")
+    ap.add_argument("--int8", action="store_true")
+    ap.add_argument("--min-conf", type=float, default=0.25, help="only boxes above this confidence are compared")
+    ap.add_argument("--box-iou", type=float, default=0.9)
+    ap.add_argument("--conf-tol", type=float, default=None, help="default 0.05, 0.15 with --int8")
+    ap.add_argument("--min-match", type=float, default=0.95)
+    args = ap.parse_args()
+    if args.conf_tol is None:
+        args.conf_tol = 0.15 if args.int8 else 0.05
+
+    cand_det = IB.load_model(IE.MODEL_PATH, args.backend, int8=args.int8)
+    cand_scnd = IB.load_model(IE.SPECIFIC_MODEL, args.backend, IE.SCND_IMGSZ, int8=args.int8)
+
+    det_found = det_total = 0
+    sp_same = sp_total = 0
+    worst = 0.0
+    for name, img in load_images(args.images):
+        ref = IE.model.predict(img, conf=IE.DETECT_CONF, verbose=False)[0]
+        cand = cand_det.predict(img, conf=IE.DETECT_CONF, verbose=False)[0]
+        f, t, w = match_boxes(above(ref, args.min_conf), above(cand, args.min_conf), args.box_iou, args.conf_tol)
+        det_found += f; det_total += t; worst = max(worst, w)
+
+        # species - the same crops (from the reference plants) through both runtimes
+        h, wd = img.shape[:2]
+        crops = [IE.letterbox(img[y1:y2, x1:x2]) for x1, y1, x2, y2 in
+                 (p["coords"] for p in IE.detection_stage(ref, wd, h))]
+        if crops:
+            a = IE.scnd_model.predict(crops, conf=IE.SCND_MIN_CONF, imgsz=IE.SCND_IMGSZ, verbose=False)
+            b = cand_scnd.predict(crops, conf=IE.SCND_MIN_CONF, imgsz=IE.SCND_IMGSZ, verbose=False)
+            for ra, rb in zip(a, b):
+                sp_same += IE.best_species(ra)[1] == IE.best_species(rb)[1]
+                sp_total += 1
+        print(f"{name}: {f}/{t} boxes matched, max conf diff {w:.3f}")
+
+    det_rate = det_found / det_total if det_total else 1.0
+    sp_rate = sp_same / sp_total if sp_total else 1.0
+    print(f"detector: {det_found}/{det_total} boxes matched ({det_rate:.3f}), max conf diff {worst:.3f}")
+    print(f"species : {sp_same}/{sp_total} crops agree ({sp_rate:.3f})")
+    ok = det_rate >= args.min_match and sp_rate >= args.min_match
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
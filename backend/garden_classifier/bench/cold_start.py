@@ -0,0 +1,83 @@
+# cold_start.py
+# measures how long a fresh pyserver takes until it answers (/healthz) and until it can run the
+# models (/readyz), for the default startup and for PY_BACKGROUND_LOAD=1. every run starts a new
+# process and polls both probes, the timings the server measured itself (from /readyz) are added.
+#
+# usage (needs the models):
+#   python bench/cold_start.py --runs 3 --json cold_start.json
+#   python bench/cold_start.py --gunicorn --modes sync background
+
+import argparse, json, os, statistics, subprocess, sys, time
+
+import requests
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {"sync": "0", "background": "1"}
+
+def first_ok(url, deadline):
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.02)
+    return False
+
+def run(mode, args):
+    env = dict(os.environ, PY_BACKGROUND_LOAD=MODES[mode], PY_PORT=str(args.port), WEATHER_PREFETCH="0")
+    cmd = ([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "image_extracter:app"] if args.gunicorn
+           else [sys.executable, "image_extracter.py"])
+    base = f"http://127.0.0.1:{args.port}"
+    t0 = time.time()
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = t0 + args.timeout
+        if not first_ok(f"{base}/healthz", deadline):
+            raise RuntimeError(f"{mode}: no answer from /healthz within {args.timeout}s")
+        healthz = time.time() - t0
+        # a model route during loading must be turned away fast, not hang
+        t = time.time()
+        early = requests.post(f"{base}/predict", files={"image": ("x.jpg", b"")}, timeout=60)
+        early_s = time.time() - t
+        if not first_ok(f"{base}/readyz", deadline):
+            raise RuntimeError(f"{mode}: /readyz did not turn ready within {args.timeout}s")
+        readyz = time.time() - t0
+        server = requests.get(f"{base}/readyz", timeout=5).json()["startup"]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=120)
+    return {"healthz_s": round(healthz, 3), "readyz_s": round(readyz, 3),
+            "early_predict_status": early.status_code, "early_predict_ms": round(early_s * 1000, 1),
+            "server": server}
+
+def main():
+    ap = argparse.ArgumentParser(description="Cold start time of the pyserver")
+    ap.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--gunicorn", action="store_true", help="start gunicorn instead of the development server")
+    ap.add_argument("--port", type=int, default=2041)
+    ap.add_argument("--timeout", type=float, default=300)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        rows = [run(mode, args) for _ in range(args.runs)]
+        results[mode] = {
+            "healthz_s": round(statistics.median(r["healthz_s"] for r in rows), 3),
+            "readyz_s": round(statistics.median(r["readyz_s"] for r in rows), 3),
+            "early_predict_status": rows[-1]["early_predict_status"],
+            "early_predict_ms": round(statistics.median(r["early_predict_ms"] for r in rows), 1),
+            "server": rows[-1]["server"],
+        }
+        r = results[mode]
+        print(f"{mode:>10}  answering {r['healthz_s']:>7.2f}s  ready {r['readyz_s']:>7.2f}s  "
+              f"early /predict {r['early_predict_status']} in {r['early_predict_ms']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"kind": "cold_start", "meta": {"gunicorn": args.gunicorn, "runs": args.runs},
+                       "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# compare.py
+# compares two result files of bench/micro.py or bench/load_replay.py case by case.
+# throughput is better when higher, every other timing / size metric when lower. a change beyond
+# --threshold in the wrong direction is a regression and makes the exit code 1 (for CI).
+#
+# usage:
+#   python bench/compare.py base.json new.json --threshold 0.1
+
+import argparse, json, sys
+
+# metrics that are compared, with True when a higher value is better
+METRICS = {
+    "ns_per_call": False,
+    "throughput_rps": True,
+    "latency_p50_ms": False,
+    "latency_p95_ms": False,
+    "latency_p99_ms": False,
+    "peak_rss_mb": False,
+    "errors": False,
+    "healthz_s": False,
+    "readyz_s": False,
+}
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare two benchmark result files")
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = ap.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    if base.get("kind") != new.get("kind"):
+        sys.exit(f"cannot compare a '{base.get('kind')}' run with a '{new.get('kind')}' run")
+
+    regressions = 0
+    print(f"{'case':>28} {'metric':>16} {'base':>12} {'new':>12} {'change':>9}")
+    for case in sorted(set(base["results"]) & set(new["results"])):
+        b, n = base["results"][case], new["results"][case]
+        for metric, higher_better in METRICS.items():
+            if metric not in b or metric not in n:
+                continue
+            old, cur = b[metric], n[metric]
+            change = (cur - old) / old if old else (0.0 if cur == old else float("inf"))
+            worse = -change if higher_better else change
+            flag = ""
+            if worse > args.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif worse < -args.threshold:
+                flag = "  improved"
+            print(f"{case:>28} {metric:>16} {old:>12} {cur:>12} {change:>+8.1%}{flag}")
+    for case in sorted(set(base["results"]) ^ set(new["results"])):
+        print(f"{case:>28} only in {'base' if case in base['results'] else 'new'}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# eval_container_policy.py
+# replays a folder of garden photos through the detector and compares container candidate policies.
+# like the server, the detector runs at the confidence a policy needs (DETECT_CONF - the lower of the
+# plant and the container floor), so a higher container floor also shows the smaller candidate set and
+# the cheaper NMS of the detector. the detector runs once per photo and detector confidence, every
+# policy sharing that confidence is applied on the same raw result.
+#
+# accuracy is the share of plants whose container matches the reference - the keep-all policy by
+# default, or a labels file: {"photo.jpg": [{"coords": [x1,y1,x2,y2], "container": "pot"}, ...]}
+#
+# usage:
+#   python bench/eval_container_policy.py --images ../uploads/photos \
+#       --min-conf 0.001 0.05 0.1 --topk 0 5 20 --nms-iou 0 0.5 0.7 --json report.json
+
+import argparse, itertools, json, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+import image_extracter as IE
+
+IMAGE_EXT = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+def load_images(folder):
+    out = []
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() in IMAGE_EXT:
+            img = cv2.imread(os.path.join(folder, name), cv2.IMREAD_COLOR)
+            if img is not None:
+                out.append((name, img))
+    return out
+
+# matching the plants of a run to the reference plants by box overlap, returns (correct, total)
+def score(plants, reference, min_match_iou=0.5):
+    if not reference:
+        return 0, 0
+    ref_boxes = np.array([r["coords"] for r in reference], dtype=np.float64)
+    correct = 0
+    if plants:
+        m = IE.iou_matrix(np.array([p["coords"] for p in plants], dtype=np.float64), ref_boxes)
+        for r_i, ref in enumerate(reference):
+            p_i = int(m[:, r_i].argmax())
+            if m[p_i, r_i] >= min_match_iou and plants[p_i]["container"] == ref["container"]:
+                correct += 1
+    return correct, len(reference)
+
+def main():
+    ap = argparse.ArgumentParser(description="Evaluate container candidate policies on a folder of photos")
+    ap.add_argument("--images", required=True, help="folder of photos to replay")
+    ap.add_argument("--labels", default=None, help="optional ground truth json, default is the keep-all policy")
+    ap.add_argument("--min-conf", type=float, nargs="+", default=[IE.PRED_CONF_KEEP_ALL, 0.05, 0.1, 0.25])
+    ap.add_argument("--topk", type=int, nargs="+", default=[0, 5, 20])
+    ap.add_argument("--nms-iou", type=float, nargs="+", default=[0.0, 0.5, 0.7])
+    ap.add_argument("--repeat", type=int, default=5, help="timing repeats of the post-processing per photo")
+    ap.add_argument("--detect-repeat", type=int, default=1, help="timing repeats of the detector per photo")
+    ap.add_argument("--json", default=None, help="write the report to this file")
+    args = ap.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        print(f"No images found in {args.images}")
+        return
+    print(f"Replaying {len(images)} photos")
+
+    # the raw results and detector times of every photo at one detector confidence (the fastest of
+    # --detect-repeat runs), each confidence is only run once
+    detections = {}
+    def detect(conf):
+        if conf not in detections:
+            raw, detect_ms = [], []
+            for name, img in images:
+                best = None
+                for _ in range(max(1, args.detect_repeat)):
+                    t0 = time.perf_counter()
+                    res = IE.model.predict(img, conf=conf, verbose=False)[0]
+                    dt = (time.perf_counter() - t0) * 1000.0
+                    best = dt if best is None else min(best, dt)
+                detect_ms.append(best)
+                raw.append((name, img.shape[0], img.shape[1], res))
+            detections[conf] = (raw, detect_ms)
+        return detections[conf]
+
+    if args.labels:
+        with open(args.labels, encoding="utf-8") as f:
+            reference = json.load(f)
+    else:
+        raw, _ = detect(IE.PRED_CONF_KEEP_ALL)
+        reference = {name: IE.detection_stage(res, w, h, IE.PRED_CONF_KEEP_ALL, 0, 0) for name, h, w, res in raw}
+
+    rows = []
+    for min_conf, topk, nms_iou in itertools.product(args.min_conf, args.topk, args.nms_iou):
+        # the same rule as DETECT_CONF of the server
+        detect_conf = max(IE.PRED_CONF_KEEP_ALL, min(IE.PLANT_MIN_CONF, min_conf))
+        raw, detect_ms = detect(detect_conf)
+        correct = total = 0
+        post_ms = []
+        containers_kept = 0
+        for (name, h, w, res), d_ms in zip(raw, detect_ms):
+            best = None
+            for _ in range(max(1, args.repeat)):
+                t0 = time.perf_counter()
+                plants = IE.detection_stage(res, w, h, min_conf, topk, nms_iou)
+                dt = (time.perf_counter() - t0) * 1000.0
+                best = dt if best is None else min(best, dt)
+            post_ms.append(best + d_ms)
+            c, t = score(plants, reference.get(name, []))
+            correct += c; total += t
+
+            xyxy, cls, conf = IE.boxes_as_arrays(res)
+            boxes, valid = IE.clamp_boxes(xyxy, w, h)
+            _, _, is_container = IE.class_tables(res.names)
+            containers_kept += len(IE.filter_containers(np.flatnonzero(valid & is_container[cls]),
+                                                        boxes, cls, conf, min_conf, topk, nms_iou))
+        lat = np.array(post_ms)
+        rows.append({
+            "min_conf": min_conf, "topk": topk, "nms_iou": nms_iou, "detect_conf": detect_conf,
+            "accuracy": round(correct / total, 4) if total else None,
+            "plants_scored": total,
+            "avg_containers": round(containers_kept / len(raw), 1),
+            "latency_ms_p50": round(float(np.percentile(lat, 50)), 2),
+            "latency_ms_p95": round(float(np.percentile(lat, 95)), 2),
+        })
+
+    print(f"{'min_conf':>9} {'det conf':>9} {'topk':>5} {'nms':>5} {'accuracy':>9} {'containers':>11} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in rows:
+        acc = "-" if r["accuracy"] is None else f"{r['accuracy']:.3f}"
+        print(f"{r['min_conf']:>9} {r['detect_conf']:>9} {r['topk']:>5} {r['nms_iou']:>5} {acc:>9} {r['avg_containers']:>11} "
+              f"{r['latency_ms_p50']:>8} {r['latency_ms_p95']:>8}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"images": len(images), "rows": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# load_replay.py
+# end-to-end load test of the pyserver - replays a folder of garden photos against /predict and a fixed
+# set of coordinates against /weather at a chosen concurrency, and reports throughput, p50/p95/p99
+# latency and peak RSS as JSON that bench/compare.py can diff between runs.
+#
+# by default the Flask app of image_extracter.py is driven in this process through its test client
+# (no HTTP, the peak RSS is the server's). the Open-Meteo calls go to bench/openmeteo_stub.py replaying
+# the recorded fixture, started here on --stub-port. --url runs the same load against a running server
+# instead (point its OPEN_METEO_URL at the stub, --server-pid adds its peak RSS).
+#
+# usage (needs the models):
+#   python bench/load_replay.py --images ../uploads/photos --concurrency 1 4 8 --requests 64 --json load.json
+#   python bench/load_replay.py --url http://localhost:2021 --server-pid <pid> --images ../uploads/photos
+
+import argparse, io, json, os, platform, random, resource, subprocess, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+IMAGE_EXT = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+FIXTURE = os.path.join(HERE, "fixtures", "openmeteo_forecast.bin")
+
+def read_photos(folder):
+    out = []
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() in IMAGE_EXT:
+            with open(os.path.join(folder, name), "rb") as f:
+                out.append((name, f.read()))
+    return out
+
+# the same coordinates every run - spread over Israel so some land in the same forecast cell
+def weather_points(n, seed=0):
+    rng = random.Random(seed)
+    return [(round(rng.uniform(29.5, 33.3), 4), round(rng.uniform(34.3, 35.8), 4)) for _ in range(n)]
+
+def start_stub(port):
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, "openmeteo_stub.py"), "--port", str(port),
+                             "--fixture", FIXTURE], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0)
+    return proc
+
+# a client with post_predict / post_weather - in process (Flask test client) or over HTTP
+class InProcess:
+    def __init__(self):
+        import image_extracter as IE
+        self.app = IE.app
+
+    def predict(self, name, data, mode):
+        with self.app.test_client() as c:
+            r = c.post("/predict", data={"image": (io.BytesIO(data), name), "mode": mode})
+            return r.status_code, len(r.data)
+
+    def weather(self, lat, lon, compact):
+        with self.app.test_client() as c:
+            r = c.post("/weather", json={"latitude": lat, "longitude": lon, "compact": compact})
+            return r.status_code, len(r.data)
+
+class OverHttp:
+    def __init__(self, url):
+        import requests
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def predict(self, name, data, mode):
+        r = self.session.post(f"{self.url}/predict", files={"image": (name, data)}, data={"mode": mode}, timeout=300)
+        return r.status_code, len(r.content)
+
+    def weather(self, lat, lon, compact):
+        r = self.session.post(f"{self.url}/weather", json={"latitude": lat, "longitude": lon, "compact": compact}, timeout=60)
+        return r.status_code, len(r.content)
+
+def peak_rss_mb(server_pid=None):
+    if server_pid:
+        with open(f"/proc/{server_pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1)
+
+def load(fn, jobs, concurrency):
+    def one(job):
+        t0 = time.perf_counter()
+        status, size = fn(*job)
+        return time.perf_counter() - t0, status, size
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as ex:
+        rows = list(ex.map(one, jobs))
+    wall = time.perf_counter() - t0
+    lat = np.array([r[0] for r in rows])
+    errors = sum(1 for r in rows if r[1] != 200)
+    return {
+        "requests": len(rows),
+        "errors": errors,
+        "throughput_rps": round(len(rows) / wall, 2),
+        "latency_p50_ms": round(float(np.percentile(lat, 50)) * 1000, 1),
+        "latency_p95_ms": round(float(np.percentile(lat, 95)) * 1000, 1),
+        "latency_p99_ms": round(float(np.percentile(lat, 99)) * 1000, 1),
+        "mean_response_kb": round(sum(r[2] for r in rows) / len(rows) / 1024.0, 1),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Load replay of /predict and /weather")
+    ap.add_argument("--images", default=os.path.join(ROOT, "..", "uploads", "photos"))
+    ap.add_argument("--url", default=None, help="a running server instead of the in-process app")
+    ap.add_argument("--server-pid", type=int, default=None)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--requests", type=int, default=64, help="requests per endpoint and concurrency")
+    ap.add_argument("--mode", choices=["full", "coords"], default="full")
+    ap.add_argument("--weather-points", type=int, default=32)
+    ap.add_argument("--no-weather", action="store_true")
+    ap.add_argument("--cache", action="store_true", help="keep the result cache on (off: every request runs the models)")
+    ap.add_argument("--stub-port", type=int, default=8089)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    photos = read_photos(args.images) if os.path.isdir(args.images) else []
+    if not photos:
+        print(f"No images found in {args.images}")
+        return
+
+    stub = None
+    if args.url is None:
+        stub = start_stub(args.stub_port)
+        os.environ["OPEN_METEO_URL"] = f"http://127.0.0.1:{args.stub_port}/v1/forecast"
+        os.environ["WEATHER_PREFETCH"] = "0"
+        if not args.cache:
+            os.environ["RESULT_CACHE_MB"] = "0"
+    try:
+        client = OverHttp(args.url) if args.url else InProcess()
+        rng = random.Random(args.seed)
+        points = weather_points(args.weather_points, args.seed)
+        results = {}
+        for c in args.concurrency:
+            jobs = [(*photos[rng.randrange(len(photos))], args.mode) for _ in range(args.requests)]
+            results[f"predict_c{c}"] = load(client.predict, jobs, c)
+            print(f"predict  c={c:<3} {results[f'predict_c{c}']}")
+            if not args.no_weather:
+                jobs = [(*points[i % len(points)], True) for i in range(args.requests)]
+                results[f"weather_c{c}"] = load(client.weather, jobs, c)
+                print(f"weather  c={c:<3} {results[f'weather_c{c}']}")
+        rss = peak_rss_mb(args.server_pid)
+        for r in results.values():
+            r["peak_rss_mb"] = rss
+    finally:
+        if stub is not None:
+            stub.terminate()
+
+    if args.json:
+        meta = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+                "images": len(photos), "mode": args.mode, "target": args.url or "in-process",
+                "env": {k: v for k, v in os.environ.items() if k.startswith(("PY_", "DETECT_", "SCND_", "INFERENCE_", "RESULT_CACHE", "WEATHER_"))}}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"kind": "load", "meta": meta, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
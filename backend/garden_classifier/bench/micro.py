@@ -0,0 +1,89 @@
+# micro.py
+# micro-benchmarks of the pyserver hot-path helpers - box math, label normalization and the weather
+# summaries. every case runs on fixed seeded inputs, the time per call is the median of --repeat runs
+# (each long enough for the timer, see timeit.Timer.autorange). the weather cases read the recorded
+# Open-Meteo fixture, so the numbers do not depend on the network.
+#
+# usage (needs the models, image_extracter loads them at import):
+#   python bench/micro.py --json micro.json
+#   python bench/compare.py base_micro.json micro.json
+
+import argparse, json, os, platform, statistics, sys, timeit
+
+os.environ.setdefault("PY_DEFER_WARMUP", "1")   # only the helpers are measured, not the models
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import numpy as np
+import image_extracter as IE
+import weatherAPI as WAPI
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+from openmeteo_stub import shift_to_today
+
+FIXTURE = os.path.join(HERE, "fixtures", "openmeteo_forecast.bin")
+
+def random_boxes(rng, n, w=1280, h=960):
+    xy = rng.uniform(0, [w, h], size=(n, 2))
+    wh = rng.uniform(20, 400, size=(n, 2))
+    return np.hstack([xy, xy + wh])
+
+# the hourly block of the fixture in the format fetch_weather_forecast returns
+def fixture_forecast(path=FIXTURE):
+    with open(path, "rb") as f:
+        body = shift_to_today(f.read(), 7)
+    hourly = WeatherApiResponse.GetRootAs(body, 4).Hourly()
+    out = {"start": int(hourly.Time()), "step": int(hourly.Interval())}
+    for i, var in enumerate(WAPI.HOURLY_VARS):
+        out[var] = hourly.Variables(i).ValuesAsNumpy()
+    return {"coordinates": {}, "hourly": out, "daily": []}
+
+def cases():
+    rng = np.random.default_rng(0)
+    boxes = random_boxes(rng, 64).round().astype(int).tolist()
+    pairs = list(zip(boxes[:32], boxes[32:]))
+    labels = ["Potted Plant", "plant-pot", "Raised Bed", "flower", "Garden bed", "tree", "Cactus", "grass"]
+    plants, conts = random_boxes(rng, 20), random_boxes(rng, 40)
+    forecast = fixture_forecast()
+    daily = WAPI.aggregate_daily(forecast["hourly"])
+
+    return {
+        # per call of the scalar helpers, the loop covers a batch of inputs
+        "iou":                  (lambda: [IE.iou(a, b) for a, b in pairs], len(pairs)),
+        "clamp":                (lambda: [IE.clamp(*b, 1280, 960) for b in boxes], len(boxes)),
+        "norm_label":           (lambda: [IE.norm_label(l) for l in labels], len(labels)),
+        "iou_matrix_20x40":     (lambda: IE.iou_matrix(plants, conts), 1),
+        "assign_containers":    (lambda: IE.assign_containers(plants, conts), 1),
+        "aggregate_daily":      (lambda: WAPI.aggregate_daily(forecast["hourly"]), 1),
+        "compute_prev_week_features": (lambda: WAPI.compute_prev_week_features(forecast["hourly"]), 1),
+        "summarize_next_week":  (lambda: WAPI.summarize_next_week(forecast), 1),
+        "summaries_shared_daily": (lambda: (WAPI.compute_prev_week_features(forecast["hourly"], daily),
+                                            WAPI.summarize_next_week(forecast, daily)), 1),
+    }
+
+def run(fn, per_call, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = [t / number / per_call for t in timer.repeat(repeat=repeat, number=number)]
+    return {"ns_per_call": round(statistics.median(runs) * 1e9, 1),
+            "ns_per_call_min": round(min(runs) * 1e9, 1), "loops": number * per_call}
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmarks of the pyserver helpers")
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--only", nargs="*", default=None, help="names of the cases to run")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    results = {}
+    for name, (fn, per_call) in cases().items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = run(fn, per_call, args.repeat)
+        print(f"{name:>28} {results[name]['ns_per_call']:>12.1f} ns/call")
+    if args.json:
+        meta = {"python": platform.python_version(), "machine": platform.machine(), "numpy": np.__version__}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"kind": "micro", "meta": meta, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# openmeteo_stub.py
+# a local stand-in for the Open-Meteo forecast API, for testing the weather cache and prefetcher
+# without the network. it answers GET /v1/forecast with the same flatbuffers body the real API sends:
+#   --fixture f.bin             replays a recorded response (the time axis is moved to the current days)
+#   --fixture f.bin --record    proxies the first request to --upstream, saves the body and replays it
+#   no fixture                  builds a synthetic forecast for the requested coordinates and variables
+#   --write-fixture f.bin       writes one synthetic forecast (the pyserver variables) to f.bin and exits
+# --delay and --fail-rate simulate a slow or failing upstream, they can also be changed while it runs:
+#   curl -X POST "localhost:8089/_control?delay=3&fail_rate=1"     (GET /_stats returns the counters)
+#
+# usage:
+#   python bench/openmeteo_stub.py --port 8089
+#   OPEN_METEO_URL=http://127.0.0.1:8089/v1/forecast python image_extracter.py
+
+import argparse, json, os, random, threading, time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+import flatbuffers
+import numpy as np
+import requests
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+
+UPSTREAM = "https://api.open-meteo.com/v1/forecast"
+SECONDS_PER_DAY = 86400
+# the hourly variables weatherAPI.fetch_weather_forecast asks for
+FIXTURE_VARS = ["temperature_2m", "precipitation", "windspeed_10m", "uv_index"]
+
+state = {"delay": 0.0, "fail_rate": 0.0, "requests": 0, "failed": 0, "fixture": None}
+state_lock = threading.Lock()
+
+# the query as the client sends it - repeated or comma separated "hourly" values
+def parse_query(path):
+    q = parse_qs(urlparse(path).query)
+    hourly = [v for item in q.get("hourly", []) for v in item.split(",") if v]
+    one = lambda k, d: q.get(k, [d])[0]
+    return {"latitude": float(one("latitude", 0)), "longitude": float(one("longitude", 0)),
+            "hourly": hourly, "past_days": int(one("past_days", 0)), "forecast_days": int(one("forecast_days", 7))}
+
+### ---- synthetic responses ---- ###
+# a plausible series per variable - a daily temperature cycle, some rain, wind and a midday uv peak
+def synthetic_series(var, hours, lat, lon):
+    rng = np.random.default_rng(abs(hash((round(lat, 2), round(lon, 2), var))) % (2 ** 32))
+    hour_of_day = np.arange(hours) % 24
+    day_curve = np.sin((hour_of_day - 9) / 24.0 * 2 * np.pi)
+    if var.startswith("temperature"):
+        v = 22 - abs(lat) / 6 + 6 * day_curve + rng.normal(0, 1, hours)
+    elif var.startswith("precipitation"):
+        v = np.where(rng.random(hours) < 0.08, rng.gamma(1.5, 1.2, hours), 0.0)
+    elif var.startswith("wind"):
+        v = np.abs(12 + 5 * day_curve + rng.normal(0, 3, hours))
+    elif var.startswith("uv"):
+        v = np.clip(8 * np.sin((hour_of_day - 6) / 12.0 * np.pi), 0, None)
+    else:
+        v = rng.normal(0, 1, hours)
+    return v.astype(np.float32)
+
+# a length prefixed WeatherApiResponse, field slots as in openmeteo_sdk
+def build_response(lat, lon, variables, past_days, forecast_days, tz_name):
+    tz = ZoneInfo(tz_name)
+    midnight = datetime.now(tz).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=past_days)
+    start = int(midnight.timestamp())
+    hours = (past_days + forecast_days) * 24
+    offset = int(midnight.utcoffset().total_seconds())
+
+    b = flatbuffers.Builder(hours * 4 * max(1, len(variables)) + 1024)
+    var_tables = []
+    for var in variables:
+        vec = b.CreateNumpyVector(synthetic_series(var, hours, lat, lon))
+        b.StartObject(15)
+        b.PrependUOffsetTRelativeSlot(3, vec, 0)
+        var_tables.append(b.EndObject())
+    b.StartVector(4, len(var_tables), 4)
+    for t in reversed(var_tables):
+        b.PrependUOffsetTRelative(t)
+    var_vec = b.EndVector()
+    b.StartObject(4)
+    b.PrependInt64Slot(0, start, 0)
+    b.PrependInt64Slot(1, start + hours * 3600, 0)
+    b.PrependInt32Slot(2, 3600, 0)
+    b.PrependUOffsetTRelativeSlot(3, var_vec, 0)
+    hourly = b.EndObject()
+    tz_str = b.CreateString(tz_name)
+    abbr = b.CreateString(midnight.tzname() or "")
+    b.StartObject(16)
+    b.PrependFloat32Slot(0, lat, 0.0)
+    b.PrependFloat32Slot(1, lon, 0.0)
+    b.PrependFloat32Slot(2, 30.0, 0.0)
+    b.PrependInt32Slot(6, offset, 0)
+    b.PrependUOffsetTRelativeSlot(7, tz_str, 0)
+    b.PrependUOffsetTRelativeSlot(8, abbr, 0)
+    b.PrependUOffsetTRelativeSlot(11, hourly, 0)
+    b.Finish(b.EndObject())
+    body = bytes(b.Output())
+    return len(body).to_bytes(4, "little") + body
+
+### ---- recorded responses ---- ###
+# moves the hourly time axis of a recorded body by whole days so it starts past_days before today again
+def shift_to_today(body, past_days):
+    buf = bytearray(body)
+    resp = WeatherApiResponse.GetRootAs(buf, 4)
+    hourly = resp.Hourly()
+    start = hourly.Time()
+    today = int(time.time() + resp.UtcOffsetSeconds()) // SECONDS_PER_DAY
+    shift = (today - past_days - (start + resp.UtcOffsetSeconds()) // SECONDS_PER_DAY) * SECONDS_PER_DAY
+    tab = hourly._tab
+    for slot in (4, 6):   # Time, TimeEnd
+        pos = tab.Pos + tab.Offset(slot)
+        flatbuffers.encode.Write(flatbuffers.packer.int64, buf, pos, int.from_bytes(buf[pos:pos + 8], "little", signed=True) + shift)
+    return bytes(buf)
+
+def record(path, args):
+    r = requests.get(args.upstream, params=path.split("?", 1)[1] if "?" in path else None, timeout=30)
+    r.raise_for_status()
+    with open(args.fixture, "wb") as f:
+        f.write(r.content)
+    return r.content
+
+class Handler(BaseHTTPRequestHandler):
+    args = None
+
+    def log_message(self, *a):
+        if self.args.verbose:
+            super().log_message(*a)
+
+    def send(self, code, body, ctype="application/octet-stream"):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/_stats"):
+            with state_lock:
+                stats = {k: v for k, v in state.items() if k != "fixture"}
+            return self.send(200, json.dumps(stats).encode(), "application/json")
+        with state_lock:
+            state["requests"] += 1
+            delay, fail_rate = state["delay"], state["fail_rate"]
+        if delay:
+            time.sleep(delay)
+        if random.random() < fail_rate:
+            with state_lock:
+                state["failed"] += 1
+            return self.send(503, b"stub: simulated upstream failure", "text/plain")
+
+        q = parse_query(self.path)
+        if self.args.fixture:
+            with state_lock:
+                if state["fixture"] is None:
+                    state["fixture"] = record(self.path, self.args) if self.args.record else open(self.args.fixture, "rb").read()
+                body = state["fixture"]
+            body = shift_to_today(body, q["past_days"])
+        else:
+            body = build_response(q["latitude"], q["longitude"], q["hourly"], q["past_days"], q["forecast_days"], self.args.timezone)
+        self.send(200, body)
+
+    def do_POST(self):
+        if not self.path.startswith("/_control"):
+            return self.send(404, b"not found", "text/plain")
+        q = parse_qs(urlparse(self.path).query)
+        with state_lock:
+            for k in ("delay", "fail_rate"):
+                if k in q:
+                    state[k] = float(q[k][0])
+            body = json.dumps({"delay": state["delay"], "fail_rate": state["fail_rate"]}).encode()
+        self.send(200, body, "application/json")
+
+def main():
+    ap = argparse.ArgumentParser(description="Local stand-in for the Open-Meteo forecast API")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--fixture", default=None, help="recorded response body to replay")
+    ap.add_argument("--record", action="store_true", help="record the fixture from --upstream on the first request")
+    ap.add_argument("--upstream", default=UPSTREAM)
+    ap.add_argument("--timezone", default="Asia/Jerusalem", help="timezone of the synthetic responses")
+    ap.add_argument("--delay", type=float, default=0.0, help="seconds before every answer")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 503")
+    ap.add_argument("--write-fixture", default=None, help="write a synthetic response for --lat/--lon to this file and exit")
+    ap.add_argument("--lat", type=float, default=32.08)
+    ap.add_argument("--lon", type=float, default=34.78)
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+    if args.write_fixture:
+        body = build_response(args.lat, args.lon, FIXTURE_VARS, 7, 7, args.timezone)
+        with open(args.write_fixture, "wb") as f:
+            f.write(body)
+        print(f"wrote {len(body)} bytes to {args.write_fixture}")
+        return
+    if args.fixture and not args.record and not os.path.exists(args.fixture):
+        ap.error(f"fixture {args.fixture} does not exist, use --record to create it")
+
+    state["delay"], state["fail_rate"] = args.delay, args.fail_rate
+    Handler.args = args
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    print(f"open-meteo stub on http://127.0.0.1:{args.port}/v1/forecast")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
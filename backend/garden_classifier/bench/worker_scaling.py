@@ -0,0 +1,134 @@
+# worker_scaling.py
+# measures throughput and memory of the gunicorn serving mode as the worker count grows.
+# for every worker count a fresh server is started, loaded with /predict requests built from a folder
+# of photos, and the memory of every worker is read from /proc - RSS counts the shared model pages in
+# every process, PSS splits them between the processes that share them. --load runs every worker count
+# once with the models preloaded in the master (the default serving) and once loaded per worker
+# (PY_BACKGROUND_LOAD=1, no preload) - the difference in PSS per worker is what the preload saves.
+#
+# usage (linux, needs the models):
+#   python bench/worker_scaling.py --images ../uploads/photos --workers 1 2 4 --concurrency 8 --requests 64
+#   python bench/worker_scaling.py --images ../uploads/photos --workers 2 4 --load preload background
+
+import argparse, json, os, subprocess, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOADS = {"preload": "0", "background": "1"}
+IMAGE_EXT = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+def read_photos(folder):
+    out = []
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() in IMAGE_EXT:
+            with open(os.path.join(folder, name), "rb") as f:
+                out.append((name, f.read()))
+    return out
+
+def children(pid):
+    out = []
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{tid}/children") as f:
+            out.extend(int(c) for c in f.read().split())
+    return out
+
+# rss / pss in MB of one process
+def memory_mb(pid):
+    vals = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                vals[parts[0][:-1].lower()] = int(parts[1]) / 1024.0
+    return vals
+
+def wait_ready(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+def run(workers, load, args, photos):
+    env = dict(os.environ, PY_WORKERS=str(workers), PY_PORT=str(args.port), PY_BACKGROUND_LOAD=LOADS[load],
+               RESULT_CACHE_MB="0")  # every request must really run the models
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "image_extracter:app"],
+                            cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        if not wait_ready(f"{base}/readyz", args.startup_timeout):
+            raise RuntimeError(f"server with {workers} workers did not start")
+        # let every worker finish its warm-up
+        while len(children(proc.pid)) < workers:
+            time.sleep(0.5)
+        time.sleep(args.settle)
+        idle = [memory_mb(c) for c in children(proc.pid)]
+
+        def one(i):
+            name, data = photos[i % len(photos)]
+            t0 = time.perf_counter()
+            r = requests.post(f"{base}/predict", files={"image": (name, data)}, timeout=300)
+            r.raise_for_status()
+            return time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as ex:
+            lat = sorted(ex.map(one, range(args.requests)))
+        wall = time.perf_counter() - t0
+        loaded = [memory_mb(c) for c in children(proc.pid)]
+        master = memory_mb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=120)
+
+    avg = lambda rows, k: round(sum(r[k] for r in rows) / len(rows), 1)
+    return {
+        "workers": workers,
+        "load": load,
+        "throughput_rps": round(args.requests / wall, 2),
+        "latency_p50_s": round(lat[len(lat) // 2], 3),
+        "latency_p95_s": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 3),
+        "master_rss_mb": round(master["rss"], 1),
+        "worker_rss_mb_idle": avg(idle, "rss"),
+        "worker_pss_mb_idle": avg(idle, "pss"),
+        "worker_rss_mb_loaded": avg(loaded, "rss"),
+        "worker_pss_mb_loaded": avg(loaded, "pss"),
+        "total_pss_mb_loaded": round(sum(r["pss"] for r in loaded) + master["pss"], 1),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Throughput and memory per worker count of the gunicorn server")
+    ap.add_argument("--images", required=True)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--load", nargs="+", choices=list(LOADS), default=["preload"],
+                    help="preload = models loaded in the master, background = every worker loads its own")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=64)
+    ap.add_argument("--port", type=int, default=2031)
+    ap.add_argument("--startup-timeout", type=float, default=300)
+    ap.add_argument("--settle", type=float, default=2.0)
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+
+    photos = read_photos(args.images)
+    if not photos:
+        print(f"No images found in {args.images}")
+        return
+    rows = [run(n, load, args, photos) for load in args.load for n in args.workers]
+
+    print(f"{'load':>10} {'workers':>7} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'RSS/worker':>11} {'PSS/worker':>11} {'total PSS':>10}")
+    for r in rows:
+        print(f"{r['load']:>10} {r['workers']:>7} {r['throughput_rps']:>7} {r['latency_p50_s']:>7} {r['latency_p95_s']:>7} "
+              f"{r['worker_rss_mb_loaded']:>11} {r['worker_pss_mb_loaded']:>11} {r['total_pss_mb_loaded']:>10}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
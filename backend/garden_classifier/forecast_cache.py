@@ -0,0 +1,206 @@
+# forecast_cache.py
+# an in-memory TTL + LRU cache for weather forecasts keyed on a grid cell.
+# concurrent misses for the same cell are coalesced - the first caller fetches from upstream and
+# every other caller of that cell waits for its result instead of sending its own request.
+# an expired forecast is still served for stale_ttl more seconds while a background refresh replaces
+# it (stale-while-revalidate), and a refresher thread renews the cells people asked for recently
+# shortly before they expire, so a request almost never waits for the upstream.
+
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+class ForecastCache:
+    # ttl         - seconds a forecast is served from memory
+    # max_entries - LRU bound on the number of cells
+    # stale_ttl   - seconds after ttl an old forecast is still served while it is refreshed
+    # workers     - background refresh threads
+    def __init__(self, ttl=3600, max_entries=4096, stale_ttl=0, workers=2):
+        self.ttl = float(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.stale_ttl = max(0.0, float(stale_ttl))
+        self.workers = max(1, int(workers))
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> [fetched_at, value, last_requested, refresh_at]
+        self._fetchers = {}             # key -> the fetch function of the cell, used by the refresher
+        self._inflight = {}             # key -> Future of the running upstream fetch
+        self._pool = None
+        self._pool_pid = None
+        self.refresh_ahead = 1.0        # share of ttl after which a refresh is due, set by the refresher
+        self.jitter = 0.0
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "stale_served": 0,
+                         "upstream_calls": 0, "upstream_errors": 0, "background_refreshes": 0}
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+
+    # the refresh point of an entry is spread by the jitter so cells fetched together do not expire together
+    def _refresh_at(self, fetched_at):
+        ahead = self.refresh_ahead * (1.0 - self.jitter * random.random())
+        return fetched_at + self.ttl * ahead
+
+    def get_or_fetch(self, key, fetch):
+        self._get_pool()
+        now = time.time()
+        with self._lock:
+            self._fetchers[key] = fetch
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry[0]
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    entry[2] = now
+                    self.counters["hits"] += 1
+                    return entry[1]
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    entry[2] = now
+                    self.counters["stale_served"] += 1
+                    stale = entry[1]
+                else:
+                    stale = None
+            else:
+                stale = None
+            fut = self._inflight.get(key)
+            if stale is not None:
+                owner = False
+            elif fut is not None:
+                self.counters["coalesced"] += 1
+                owner = False
+            else:
+                self.counters["misses"] += 1
+                fut = self._inflight[key] = Future()
+                owner = True
+        if stale is not None:
+            self.refresh_async(key)
+            return stale
+        if not owner:
+            return fut.result()
+        return self._fetch(key, fetch, fut)
+
+    # runs the upstream fetch of a key whose in-flight Future the caller owns
+    def _fetch(self, key, fetch, fut):
+        t0 = time.perf_counter()
+        try:
+            value = fetch()
+        except Exception as e:
+            with self._lock:
+                self.counters["upstream_errors"] += 1
+                del self._inflight[key]
+                if key not in self._entries:
+                    self._fetchers.pop(key, None)
+            fut.set_exception(e)
+            raise
+        dt = time.perf_counter() - t0
+        with self._lock:
+            self.counters["upstream_calls"] += 1
+            self._latency_sum += dt
+            self._latency_max = max(self._latency_max, dt)
+            old = self._entries.get(key)
+            now = time.time()
+            self._entries[key] = [now, value, old[2] if old else now, self._refresh_at(now)]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._fetchers.pop(evicted, None)
+            del self._inflight[key]
+        fut.set_result(value)
+        return value
+
+    # the pool is rebuilt in processes forked after import, threads do not survive fork()
+    def _get_pool(self):
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="forecast-refresh")
+                    # fetches in flight in the parent never finish in a forked child
+                    if self._pool_pid is not None:
+                        self._inflight = {}
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    # starts a background refresh of a key unless one is already running.
+    # a failed refresh keeps the old forecast, the next request or refresher pass tries again
+    def refresh_async(self, key):
+        pool = self._get_pool()
+        with self._lock:
+            fetch = self._fetchers.get(key)
+            if fetch is None or key in self._inflight:
+                return False
+            fut = self._inflight[key] = Future()
+            self.counters["background_refreshes"] += 1
+
+        def run():
+            try:
+                self._fetch(key, fetch, fut)
+            except Exception:
+                pass
+        pool.submit(run)
+        return True
+
+    # keys that are due for a refresh and were requested within the last active_s seconds
+    def due(self, active_s):
+        now = time.time()
+        with self._lock:
+            return [k for k, e in self._entries.items()
+                    if e[3] <= now and now - e[2] <= active_s and k not in self._inflight]
+
+    def stats(self):
+        with self._lock:
+            c = self.counters
+            lookups = c["hits"] + c["misses"] + c["coalesced"] + c["stale_served"]
+            calls = c["upstream_calls"]
+            return {
+                **c,
+                "hit_rate": round((c["hits"] + c["coalesced"] + c["stale_served"]) / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "upstream_latency_avg_ms": round(self._latency_sum / calls * 1000.0, 1) if calls else 0.0,
+                "upstream_latency_max_ms": round(self._latency_max * 1000.0, 1),
+            }
+
+class ForecastRefresher:
+    # cache         - the ForecastCache whose active cells are renewed
+    # interval      - seconds between two passes over the cache
+    # refresh_ahead - share of the ttl after which a cell is refreshed (0.8 - at 80% of its lifetime)
+    # active_s      - only cells requested within this many seconds are kept warm
+    # jitter        - random share taken off the refresh point and the interval, spreads the upstream calls
+    def __init__(self, cache, interval=60, refresh_ahead=0.8, active_s=86400, jitter=0.1):
+        self.cache = cache
+        self.interval = max(1.0, float(interval))
+        self.active_s = float(active_s)
+        self.jitter = min(max(0.0, float(jitter)), 0.9)
+        cache.refresh_ahead = min(max(0.1, float(refresh_ahead)), 1.0)
+        cache.jitter = self.jitter
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.passes = 0
+
+    # started lazily on the first weather request and again after a fork, like the inference batchers
+    def ensure_running(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="forecast-refresher", daemon=True)
+            self._thread.start()
+
+    def run_once(self):
+        started = 0
+        for key in self.cache.due(self.active_s):
+            started += self.cache.refresh_async(key)
+        self.passes += 1
+        return started
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval * (1.0 - self.jitter * random.random()))
+            try:
+                self.run_once()
+            except Exception:
+                pass
@@ -0,0 +1,235 @@
+# geocoding.py
+# place name -> coordinates through Nominatim, with a cache in front of it.
+# names are normalized ("  Tel-Aviv , Israel" and "tel-aviv, israel" are the same place) and kept in
+# memory and in a small sqlite file that survives restarts and is shared by the gunicorn workers.
+# the upstream is only called through a token bucket - Nominatim allows one request per second per
+# application and bans clients that burst - and the bucket state lives in the same sqlite file so all
+# workers together stay under the limit.
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from geopy.geocoders import Nominatim
+
+GEOCODE_CACHE_PATH     = os.getenv("GEOCODE_CACHE_PATH", ".geocode_cache.sqlite")
+GEOCODE_CACHE_MAX      = int(os.getenv("GEOCODE_CACHE_MAX", "10000"))       # names kept in memory
+GEOCODE_NEGATIVE_TTL_S = float(os.getenv("GEOCODE_NEGATIVE_TTL_S", "86400"))  # "not found" is retried after this
+GEOCODE_RATE           = float(os.getenv("GEOCODE_RATE", "1.0"))     # upstream requests per second, all workers
+GEOCODE_BURST          = float(os.getenv("GEOCODE_BURST", "1"))
+GEOCODE_TIMEOUT_S      = float(os.getenv("GEOCODE_TIMEOUT_S", "10"))
+GEOCODE_MAX_WAIT_S     = float(os.getenv("GEOCODE_MAX_WAIT_S", "30"))    # longest wait for a token
+GEOCODE_USER_AGENT     = os.getenv("GEOCODE_USER_AGENT", "weather_app")
+GEOCODE_DOMAIN         = os.getenv("GEOCODE_DOMAIN", "")                  # a self hosted nominatim
+
+class RateLimited(Exception):
+    pass
+
+# "  Tel-Aviv ,Israel " -> "tel-aviv, israel"
+def normalize_place(name):
+    name = unicodedata.normalize("NFKC", str(name)).casefold()
+    name = re.sub(r"\s*,\s*", ", ", name)
+    return re.sub(r"\s+", " ", name).strip(" ,")
+
+### ---- sqlite store ---- ###
+# one connection per thread and process, sqlite connections must not cross either
+_local = threading.local()
+
+def _db():
+    if not GEOCODE_CACHE_PATH:
+        return None
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(GEOCODE_CACHE_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS places (name TEXT PRIMARY KEY, lat REAL, lon REAL, fetched_at REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY CHECK (id = 0), tokens REAL, updated_at REAL)")
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+class TokenBucket:
+    # rate  - tokens added per second
+    # burst - the most tokens that can be saved up
+    # the state is kept in the sqlite file when there is one, so every process draws from the same bucket
+    def __init__(self, rate=1.0, burst=1.0):
+        self.rate = max(1e-6, float(rate))
+        self.burst = max(1.0, float(burst))
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    # takes one token if there is one, otherwise returns the seconds until the next one
+    def _take_local(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+    def _take_shared(self, conn):
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM bucket WHERE id = 0").fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+            wait = 0.0
+            if tokens >= 1.0:
+                tokens -= 1.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            conn.execute("INSERT OR REPLACE INTO bucket (id, tokens, updated_at) VALUES (0, ?, ?)", (tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    # blocks until a token is available, gives up with RateLimited after max_wait seconds
+    def acquire(self, max_wait=GEOCODE_MAX_WAIT_S):
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                conn = _db()
+                wait = self._take_shared(conn) if conn is not None else self._take_local()
+            if wait == 0.0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(f"no geocoding token within {max_wait}s")
+            time.sleep(wait)
+
+bucket = TokenBucket(GEOCODE_RATE, GEOCODE_BURST)
+
+### ---- geocoder ---- ###
+# one geolocator per process instead of one per call
+_geolocator = None
+_geolocator_pid = None
+_geolocator_lock = threading.Lock()
+
+def get_geolocator():
+    global _geolocator, _geolocator_pid
+    if _geolocator is None or _geolocator_pid != os.getpid():
+        with _geolocator_lock:
+            if _geolocator is None or _geolocator_pid != os.getpid():
+                kwargs = {"user_agent": GEOCODE_USER_AGENT, "timeout": GEOCODE_TIMEOUT_S}
+                if GEOCODE_DOMAIN:
+                    kwargs["domain"] = GEOCODE_DOMAIN
+                _geolocator = Nominatim(**kwargs)
+                _geolocator_pid = os.getpid()
+    return _geolocator
+
+_mem = OrderedDict()      # normalized name -> (lat, lon, fetched_at), lat and lon are None for "not found"
+_mem_lock = threading.Lock()
+counters = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "not_found": 0, "upstream_calls": 0, "upstream_errors": 0}
+
+def _remember(key, value):
+    with _mem_lock:
+        _mem[key] = value
+        _mem.move_to_end(key)
+        while len(_mem) > GEOCODE_CACHE_MAX:
+            _mem.popitem(last=False)
+
+# the cached coordinates of a normalized name, None when unknown, (None, None) when known not to exist
+def _cached(key):
+    now = time.time()
+    with _mem_lock:
+        value = _mem.get(key)
+        if value is not None and (value[0] is not None or now - value[2] < GEOCODE_NEGATIVE_TTL_S):
+            _mem.move_to_end(key)
+            counters["hits_memory"] += 1
+            return value[:2]
+    conn = _db()
+    if conn is None:
+        return None
+    row = conn.execute("SELECT lat, lon, fetched_at FROM places WHERE name = ?", (key,)).fetchone()
+    if row is None or (row[0] is None and now - row[2] >= GEOCODE_NEGATIVE_TTL_S):
+        return None
+    _remember(key, row)
+    with _mem_lock:
+        counters["hits_disk"] += 1
+    return row[:2]
+
+def _store(key, lat, lon):
+    now = time.time()
+    _remember(key, (lat, lon, now))
+    conn = _db()
+    if conn is not None:
+        conn.execute("INSERT OR REPLACE INTO places (name, lat, lon, fetched_at) VALUES (?, ?, ?, ?)", (key, lat, lon, now))
+
+# concurrent lookups of the same new name wait for the first one instead of spending tokens
+_name_locks = {}
+
+def _lookup(key):
+    hit = _cached(key)
+    if hit is not None:
+        return hit
+    with _mem_lock:
+        lock = _name_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            hit = _cached(key)
+            if hit is not None:
+                return hit
+            return _fetch(key)
+    finally:
+        with _mem_lock:
+            _name_locks.pop(key, None)
+
+def _fetch(key):
+    with _mem_lock:
+        counters["misses"] += 1
+    bucket.acquire()
+    try:
+        location = get_geolocator().geocode(key)
+    except Exception:
+        with _mem_lock:
+            counters["upstream_errors"] += 1
+        raise
+    finally:
+        with _mem_lock:
+            counters["upstream_calls"] += 1
+    if not location:
+        with _mem_lock:
+            counters["not_found"] += 1
+        _store(key, None, None)
+        return (None, None)
+    _store(key, float(location.latitude), float(location.longitude))
+    return (float(location.latitude), float(location.longitude))
+
+# Geocodes a location name to latitude and longitude, raises ValueError when it does not exist
+def geocode(location_name):
+    lat, lon = _lookup(normalize_place(location_name))
+    if lat is None:
+        raise ValueError(f"Location '{location_name}' not found")
+    return lat, lon
+
+# geocodes a list of names - each distinct place is looked up once and new places go to the upstream
+# one after the other through the token bucket (Nominatim does not allow parallel bulk requests).
+# returns {name: (lat, lon) or None}, errors of single names are reported as None
+def geocode_many(names):
+    out, keys = {}, {}
+    for name in names:
+        keys.setdefault(normalize_place(name), []).append(name)
+    for key, originals in keys.items():
+        try:
+            lat, lon = _lookup(key)
+            value = None if lat is None else (lat, lon)
+        except Exception:
+            value = None
+        for name in originals:
+            out[name] = value
+    return out
+
+def geocode_stats():
+    with _mem_lock:
+        c = dict(counters)
+        entries = len(_mem)
+    hits = c["hits_memory"] + c["hits_disk"]
+    lookups = hits + c["misses"]
+    return {**c, "hit_rate": round(hits / lookups, 4) if lookups else 0.0, "entries": entries,
+            "disk": bool(GEOCODE_CACHE_PATH), "rate_per_s": GEOCODE_RATE}
@@ -0,0 +1,58 @@
+# gunicorn.conf.py
+# production serving of the pyserver - N worker processes forked from one master.
+# preload_app loads image_extracter (and with it both models) once in the master before forking, the
+# workers start from those pages copy-on-write instead of loading the weights again. how much of them
+# stays shared under load (torch may touch the tensors) is not measured yet - bench/worker_scaling.py
+# --load preload background prints PSS per worker with and without the preload.
+#
+#   gunicorn -c gunicorn.conf.py image_extracter:app
+#
+# graceful restart: `kill -HUP <master pid>` replaces the workers one by one, each old worker finishes
+# its in-flight requests (up to graceful_timeout) before it exits. new code or new weights need a full
+# reload of the master: `kill -USR2 <master pid>` starts a new master next to the old one, then
+# `kill -WINCH` + `kill -QUIT` the old master once the new workers answer.
+#
+# PY_BACKGROUND_LOAD=1 trades the shared weights for a fast start: nothing is preloaded, every worker
+# listens right away and loads its own copy of the models in the background (RSS grows per worker),
+# /readyz turns 200 once they are warm. by default the master loads them before any worker listens.
+
+import gc
+import multiprocessing
+import os
+
+PY_WORKERS        = int(os.getenv("PY_WORKERS", "2"))
+PY_WORKER_THREADS = int(os.getenv("PY_WORKER_THREADS", "4"))
+PY_BACKGROUND_LOAD = os.getenv("PY_BACKGROUND_LOAD", "0") == "1"
+# torch / OpenCV intra-op threads of every worker, by default the cores are split evenly
+PY_INTRA_OP_THREADS = int(os.getenv("PY_INTRA_OP_THREADS", "0")) or max(1, multiprocessing.cpu_count() // PY_WORKERS)
+
+# the app module reads this at import and leaves the warm-up to post_fork
+os.environ["PY_DEFER_WARMUP"] = "1"
+# libraries that size their thread pools on import (OpenMP, MKL, OpenBLAS) see the per worker budget
+for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(var, str(PY_INTRA_OP_THREADS))
+
+bind = f"0.0.0.0:{os.getenv('PY_PORT', '2021')}"
+workers = PY_WORKERS
+# request threads of a worker - they wait on the micro-batchers so a few of them keep the models busy
+worker_class = "gthread"
+threads = PY_WORKER_THREADS
+# a background loading thread must not run in the master, it would not survive the fork
+preload_app = not PY_BACKGROUND_LOAD
+timeout = 120
+graceful_timeout = 60
+keepalive = 5
+
+# everything allocated while loading the app is moved out of the garbage collector's reach, so the
+# first collection in a worker does not write to every object header (and copy those pages)
+def pre_fork(server, worker):
+    gc.freeze()
+
+def post_fork(server, worker):
+    import image_extracter
+    image_extracter.configure_worker(PY_INTRA_OP_THREADS)
+    server.log.info(f"worker {worker.pid} configured, {PY_INTRA_OP_THREADS} intra-op threads")
+
+def post_worker_init(worker):
+    import image_extracter
+    image_extracter.mark_listening()
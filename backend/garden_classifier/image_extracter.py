@@ -1,20 +1,34 @@
-from ultralytics import YOLO
 import cv2
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 app = Flask(__name__)
 CORS(app)
 import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 import numpy as np
-import weatherAPI as WAPI
+from inference_scheduler import MicroBatcher
+import result_cache as RC
+import image_frontend as IF
+import inference_backend as IB
+import metrics as M
+M.install(app)  # request timers and the opt-in X-Profile profiler
 
 ### ------------------------- plants model configuration -------------------------------------- ###
 
 MODEL_PATH = "/models/my_model.pt" 
 SPECIFIC_MODEL = "/models/specific_plant_model.pt" 
-model = YOLO(MODEL_PATH, task='detect') # object detection model 
-scnd_model = YOLO(SPECIFIC_MODEL,task='detect') # specific plant detection
+SCND_IMGSZ = int(os.getenv("SCND_IMGSZ", "640"))  # every species crop is letterboxed to this size
+# INFERENCE_BACKEND picks the runtime (torch / onnx / openvino), see inference_backend.py.
+# both are set by load_models (see the startup section below)
+model = None       # object detection model
+scnd_model = None  # specific plant detection
 
 # defining the classes names as the model call 
 PLANT_CLASSES_N     = {"plant", "flower", "tree","cactus"}
@@ -26,11 +40,87 @@ MIN_IOU        = 0.05            # weight for container inferr
 PRED_CONF_KEEP_ALL = 0.001       
 SCND_MIN_CONF = 0.80              # weight for plant detection
 
+# container candidate policy - the defaults keep every container like before.
+# CONTAINER_MIN_CONF is a confidence floor, CONTAINER_TOPK keeps the best K boxes of every container
+# class (0 = no cap) and CONTAINER_NMS_IOU runs class-aware NMS between containers (0 = off)
+CONTAINER_MIN_CONF = float(os.getenv("CONTAINER_MIN_CONF", str(PRED_CONF_KEEP_ALL)))
+CONTAINER_TOPK     = int(os.getenv("CONTAINER_TOPK", "0"))
+CONTAINER_NMS_IOU  = float(os.getenv("CONTAINER_NMS_IOU", "0"))
+# the detector only has to return boxes that some later filter may keep
+DETECT_CONF = max(PRED_CONF_KEEP_ALL, min(PLANT_MIN_CONF, CONTAINER_MIN_CONF))
+
+# species stage batching - a whole chunk of letterboxed crops fits one tensor
+SCND_BATCH_SIZE = int(os.getenv("SCND_BATCH_SIZE", "16"))
+
+# cross-request micro-batching - how many images/crops one inference may take and how long to wait for them
+DETECT_BATCH_MAX     = int(os.getenv("DETECT_BATCH_MAX", "4"))
+DETECT_BATCH_WAIT_MS = float(os.getenv("DETECT_BATCH_WAIT_MS", "10"))
+SCND_BATCH_WAIT_MS   = float(os.getenv("SCND_BATCH_WAIT_MS", "5"))
+
+# crop delivery - quality and size of the JPEG crops
+CROP_JPEG_QUALITY = int(os.getenv("CROP_JPEG_QUALITY", "95"))
+CROP_MAX_SIDE     = int(os.getenv("CROP_MAX_SIDE", "0"))
+
+# result cache - identical uploads are answered from here instead of running both models again.
+# RESULT_CACHE_MB=0 turns it off, RESULT_CACHE_DIR adds a disk tier and RESULT_CACHE_PHASH=1 also
+# matches re-encoded copies of the same photo by their perceptual hash
+RESULT_CACHE_MB    = float(os.getenv("RESULT_CACHE_MB", "64"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "3600"))
+RESULT_CACHE_DIR   = os.getenv("RESULT_CACHE_DIR", "")
+RESULT_CACHE_PHASH = os.getenv("RESULT_CACHE_PHASH", "0") == "1"
+
+# anything that changes the detections - a new fingerprint invalidates every cached result
+CACHE_NAMESPACE = RC.fingerprint(
+    RC.file_signature(MODEL_PATH), RC.file_signature(SPECIFIC_MODEL), IB.INFERENCE_BACKEND, IB.INFERENCE_INT8,
+    PLANT_MIN_CONF, MIN_IOU, PRED_CONF_KEEP_ALL, SCND_MIN_CONF, SCND_IMGSZ,
+    CONTAINER_MIN_CONF, CONTAINER_TOPK, CONTAINER_NMS_IOU, CROP_JPEG_QUALITY, CROP_MAX_SIDE,
+    IF.DECODE_MAX_SIDE, IF.TILE_MODE, IF.TILE_SIZE, IF.TILE_OVERLAP, IF.TILE_MIN_SIDE, IF.TILE_MERGE_IOS, IF.TILE_MERGE_IOU,
+    "fingerprint-v1",
+)
+result_cache = RC.ResultCache(RESULT_CACHE_MB, RESULT_CACHE_TTL_S, RESULT_CACHE_DIR or None, CACHE_NAMESPACE)
+
+# uploads analyzed in "coords" / "multipart" mode are kept (encoded) so /crop can cut crops later.
+# with several workers IMAGE_STORE_DIR must be set, /crop may land on another worker than /predict
+IMAGE_STORE_MB    = float(os.getenv("IMAGE_STORE_MB", "256"))
+IMAGE_STORE_TTL_S = float(os.getenv("IMAGE_STORE_TTL_S", "900"))
+IMAGE_STORE_DIR   = os.getenv("IMAGE_STORE_DIR", "")
+image_store = RC.ResultCache(IMAGE_STORE_MB, IMAGE_STORE_TTL_S, IMAGE_STORE_DIR or None, kind="images")
+# /crop keeps the last photos it cut from decoded, bounded by their pixels (a 12 MP photo is ~36 MB)
+CROP_DECODED_MB = float(os.getenv("CROP_DECODED_MB", "128"))
+# bounds of the quality / max_side query parameters of /crop
+CROP_QUALITY_RANGE = (1, 100)
+CROP_SIDE_RANGE    = (16, 8192)
+
+# incremental re-analysis - /predict may get the previous detections of the same garden area, a new plant
+# whose box overlaps a previous one by REUSE_MIN_IOU and whose crop fingerprint is within
+# REUSE_MAX_HASH_DIST bits / REUSE_MAX_COLOR_DIFF levels of the stored one keeps its species instead
+# of going through the second model again
+REUSE_MIN_IOU        = float(os.getenv("REUSE_MIN_IOU", "0.5"))
+REUSE_MAX_HASH_DIST  = int(os.getenv("REUSE_MAX_HASH_DIST", "10"))
+REUSE_MAX_COLOR_DIFF = int(os.getenv("REUSE_MAX_COLOR_DIFF", "16"))
+PREVIOUS_MAX         = int(os.getenv("PREVIOUS_MAX", "500"))
+
+# response modes of /predict
+#   full      - every plant carries its crop as a base64 JPEG (the default)
+#   coords    - coordinates only, every plant has a crop_url to fetch its crop lazily from /crop
+#   multipart - multipart/mixed: the coords JSON first, then every crop as a raw image/jpeg part
+PREDICT_MODES = ("full", "coords", "multipart")
+
 ### ------------------------- helper functions -------------------------------------- ###
 
+# crops are shrunk so their longer side is at most CROP_MAX_SIDE (0 keeps the full size)
+def encode_jpeg(img, quality=None, max_side=None):
+    quality = CROP_JPEG_QUALITY if quality is None else quality
+    max_side = CROP_MAX_SIDE if max_side is None else max_side
+    h, w = img.shape[:2]
+    if max_side and max(h, w) > max_side:
+        r = max_side / max(h, w)
+        img = cv2.resize(img, (max(1, int(w * r)), max(1, int(h * r))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    return buf.tobytes() if ok else b""
+
 def encode_b64(img):
-    ok, buf = cv2.imencode(".jpg", img)
-    return base64.b64encode(buf).decode("utf-8") if ok else ""
+    return base64.b64encode(encode_jpeg(img)).decode("utf-8")
 
 def clamp(x1,y1,x2,y2,w,h):
     x1 = max(0, min(int(x1), w-1)); x2 = max(0, min(int(x2), w-1))
@@ -101,18 +191,119 @@ def canonical_container(lbl_n: str) -> str:
         return lbl_n
     return "unknown"
 
-def identify_species(crop_bgr: np.ndarray):
-    if scnd_model is None or crop_bgr is None or crop_bgr.size == 0:
-        return None, None, 0.0
+# ---- vectorized box helpers ----
+# the detector is run with conf=PRED_CONF_KEEP_ALL so a photo can carry hundreds of boxes,
+# these do the same work as clamp() / iou() above but over whole (N,4) arrays at once.
+
+# same as clamp() for every row - int() truncates toward zero so np.trunc is used before clipping
+def clamp_boxes(xyxy, w, h):
+    b = np.trunc(np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)).astype(np.int64)
+    b[:, [0, 2]] = np.clip(b[:, [0, 2]], 0, w-1)
+    b[:, [1, 3]] = np.clip(b[:, [1, 3]], 0, h-1)
+    valid = (b[:, 2] > b[:, 0]) & (b[:, 3] > b[:, 1])
+    return b, valid
+
+# the iou of every box in a (N,4) against every box in b (M,4), returned as a (N,M) matrix
+def iou_matrix(a, b):
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0]); iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2]); iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter + 1e-9
+    return np.where(inter > 0, inter / union, 0.0)
 
-    # predict on the crop
-    res = scnd_model.predict(crop_bgr, conf=SCND_MIN_CONF, verbose=False)[0]
+# for every plant the index of the container it overlaps the most (-1 when below MIN_IOU) and that iou.
+# argmax keeps the first container on ties, just like the old strict ">" loop did
+def assign_containers(plant_boxes, container_boxes, min_iou=MIN_IOU):
+    n = len(plant_boxes)
+    if n == 0 or len(container_boxes) == 0:
+        return np.full(n, -1, dtype=np.int64), np.zeros(n)
+    m = iou_matrix(plant_boxes, container_boxes)
+    best = m.argmax(axis=1)
+    best_iou = m[np.arange(n), best]
+    keep = (best_iou > 0) & (best_iou >= min_iou)
+    return np.where(keep, best, -1), np.where(keep, best_iou, 0.0)
+
+# greedy non maximum suppression - returns the indices (into boxes) that survive, best score first
+def nms(boxes, scores, iou_thr):
+    order = np.argsort(-scores, kind="stable")
+    if len(order) < 2:
+        return order
+    m = iou_matrix(boxes[order], boxes[order])
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= m[i] > iou_thr
+    return order[keep]
+
+# applying the container candidate policy on the container indices of a detection.
+# floor -> per class NMS -> per class top K, everything stays as index arrays
+def filter_containers(idx, boxes, cls, conf, min_conf=CONTAINER_MIN_CONF, topk=CONTAINER_TOPK, nms_iou=CONTAINER_NMS_IOU):
+    idx = idx[conf[idx] >= min_conf]
+    if (topk <= 0 and nms_iou <= 0) or len(idx) == 0:
+        return idx
+    kept = []
+    for c in np.unique(cls[idx]):
+        ci = idx[cls[idx] == c]
+        if nms_iou > 0:
+            ci = ci[nms(boxes[ci], conf[ci], nms_iou)]
+        else:
+            ci = ci[np.argsort(-conf[ci], kind="stable")]
+        if topk > 0:
+            ci = ci[:topk]
+        kept.append(ci)
+    # back to the original detection order so ties in the matching resolve the same way
+    return np.sort(np.concatenate(kept))
+
+# label normalization done once per class id instead of once per box.
+# names is the {id: label} dict of a model so the tables are cached per model
+@lru_cache(maxsize=8)
+def _class_tables(names_items):
+    size = max((int(k) for k, _ in names_items), default=-1) + 1
+    labels_n = [""] * size
+    for k, v in names_items:
+        labels_n[int(k)] = norm_label(v)
+    is_plant     = np.array([l in PLANT_CLASSES_N for l in labels_n], dtype=bool)
+    is_container = np.array([l in CONTAINER_CLASSES_N for l in labels_n], dtype=bool)
+    return labels_n, is_plant, is_container
+
+def class_tables(names):
+    items = names.items() if isinstance(names, dict) else enumerate(names)
+    return _class_tables(tuple(items))
+
+# pulling the xyxy / cls / conf of a YOLO result as numpy arrays without going through python lists
+def boxes_as_arrays(res):
+    b = res.boxes
+    xyxy = b.xyxy.cpu().numpy().reshape(-1, 4)
+    cls  = b.cls.cpu().numpy().astype(np.int64)
+    conf = b.conf.cpu().numpy()
+    return xyxy, cls, conf
+
+# resizing an image to a size x size square while keeping its aspect ratio, the rest is padded with gray.
+# this is the same letterbox YOLO does internally, doing it ourselves makes every crop the same shape
+# so a list of crops becomes a single batch tensor instead of one forward pass per crop.
+def letterbox(img, size=SCND_IMGSZ, pad_value=114):
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nw, nh = max(1, int(round(w * r))), max(1, int(round(h * r)))
+    resized = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR) if (nw, nh) != (w, h) else img
+    out = np.full((size, size, 3), pad_value, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    out[top:top+nh, left:left+nw] = resized
+    return out
+
+# picking the most confident known species out of a single result of the second model
+def best_species(res):
     names = res.names
     best = None
     best_conf = -1.0
-    for xyxy, cls, conf in zip(res.boxes.xyxy.tolist(),
-                               res.boxes.cls.tolist(),
-                               res.boxes.conf.tolist()):
+    for cls, conf in zip(res.boxes.cls.tolist(), res.boxes.conf.tolist()):
         raw = names[int(cls)]
         n   = norm_label(raw)
         if n in SCND_CLASSES_N:
@@ -124,94 +315,726 @@ def identify_species(crop_bgr: np.ndarray):
         return None, None, 0.0
     return best
 
+# running the second model over a list of crops - the crops are letterboxed and sent
+# in chunks of SCND_BATCH_SIZE, the results come back in the same order as the crops
+@M.timed("species_batch")
+def _classify_crops(crops):
+    out = []
+    for start in range(0, len(crops), SCND_BATCH_SIZE):
+        batch = [letterbox(c) for c in crops[start:start + SCND_BATCH_SIZE]]
+        results = scnd_model.predict(batch, conf=SCND_MIN_CONF, imgsz=SCND_IMGSZ, verbose=False)
+        out.extend(best_species(res) for res in results)
+    return out
+
+@M.timed("detect_batch")
+def _detect_images(imgs):
+    return model.predict(imgs, conf=DETECT_CONF, verbose=False)
+
+# the schedulers in front of the two models, requests running at the same time share one forward pass
+detect_batcher  = MicroBatcher("detect", _detect_images, DETECT_BATCH_MAX, DETECT_BATCH_WAIT_MS / 1000.0)
+species_batcher = MicroBatcher("species", _classify_crops, SCND_BATCH_SIZE, SCND_BATCH_WAIT_MS / 1000.0)
+
+### ------------------------- startup -------------------------------------- ###
+# by default both models are loaded while this module is imported, so the server only listens once they
+# are ready (and gunicorn loads them once in the master, see gunicorn.conf.py).
+# PY_BACKGROUND_LOAD=1 - the server listens right away and a background thread loads the models, warms
+# them up and then imports the weather stack. until the models are warm the model routes answer a fast
+# 503 with Retry-After instead of hanging, /healthz is the liveness probe and /readyz the readiness probe
+PY_BACKGROUND_LOAD = os.getenv("PY_BACKGROUND_LOAD", "0") == "1"
+PY_RETRY_AFTER_S   = int(os.getenv("PY_RETRY_AFTER_S", "5"))
+# the routes that need the models - everything else (weather, crop, stats) is served during loading
+MODEL_ROUTES = {"predict", "predict_stream", "predict_batch"}
+
+# the start of this process (from /proc, so interpreter start and imports count), the cold start
+# timings in seconds since then are reported by /readyz and /stats
+def _process_start_time():
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+_process_start = _process_start_time()
+startup = {"mode": "background" if PY_BACKGROUND_LOAD else "sync", "listening_s": None,
+           "models_loaded_s": None, "warmed_s": None, "ready_s": None, "error": None}
+models_ready = threading.Event()
+
+def _mark(stage):
+    startup[stage] = round(time.time() - _process_start, 3)
+
+# called by whatever serves the app right before it accepts connections
+def mark_listening():
+    _mark("listening_s")
+
+def load_models():
+    global model, scnd_model
+    with M.stage("model_load"):
+        model = IB.load_model(MODEL_PATH)
+        scnd_model = IB.load_model(SPECIFIC_MODEL, imgsz=SCND_IMGSZ)
+    _mark("models_loaded_s")
+
+# the first real request should not pay for graph initialization
+def warm_models():
+    IB.warmup(model, batch=DETECT_BATCH_MAX, conf=DETECT_CONF)
+    IB.warmup(scnd_model, batch=SCND_BATCH_SIZE, size=SCND_IMGSZ, imgsz=SCND_IMGSZ, conf=SCND_MIN_CONF)
+    _mark("warmed_s")
+
+def set_ready():
+    _mark("ready_s")
+    models_ready.set()
+    print(f"pyserver {os.getpid()} ready after {startup['ready_s']}s "
+          f"(models loaded {startup['models_loaded_s']}s, warm {startup['warmed_s']}s)", flush=True)
+
+# the weather stack (openmeteo, requests_cache, astral, geopy) is imported here and not at the top of
+# the module, the server does not wait for it. after the first call it is a sys.modules lookup
+def weather_api():
+    import weatherAPI
+    return weatherAPI
+
+def _background_load():
+    try:
+        load_models()
+        warm_models()
+        set_ready()
+        weather_api()
+    except Exception as e:
+        startup["error"] = f"{type(e).__name__}: {e}"
+        app.logger.exception("loading the models failed")
+
+def start_background_load():
+    threading.Thread(target=_background_load, name="model-loader", daemon=True).start()
+
+# a worker forked by gunicorn (see gunicorn.conf.py) - the weights were loaded once in the master and
+# are shared copy-on-write. every worker gets its own slice of the cores for the torch/OpenCV thread
+# pools so N workers don't oversubscribe the machine, and warms up only after the fork because the
+# OpenMP thread pool behind torch must not be started before fork()
+def configure_worker(intra_op_threads):
+    cv2.setNumThreads(intra_op_threads)
+    try:
+        import torch
+        torch.set_num_threads(intra_op_threads)
+    except ImportError:
+        pass
+    if PY_BACKGROUND_LOAD:
+        # no preload - every worker loads its own models after the fork
+        start_background_load()
+        return
+    warm_models()
+    set_ready()
+
+# PY_DEFER_WARMUP is set by gunicorn.conf.py, the single process server warms up right away
+if PY_BACKGROUND_LOAD:
+    if os.getenv("PY_DEFER_WARMUP", "0") != "1":
+        start_background_load()
+else:
+    load_models()
+    weather_api()
+    # deferred - the gunicorn workers warm up and turn ready after the fork (configure_worker)
+    if os.getenv("PY_DEFER_WARMUP", "0") != "1":
+        warm_models()
+        set_ready()
+
+# requests for the models before they are ready are turned away right away, the client retries later
+@app.before_request
+def _gate_until_ready():
+    if request.endpoint in MODEL_ROUTES and not models_ready.is_set():
+        resp = jsonify({"error": "models_loading", "message": startup["error"] or "the models are still loading",
+                        "retry_after_s": PY_RETRY_AFTER_S})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(PY_RETRY_AFTER_S)
+        return resp
+
+# classifying many crops at once through the species scheduler, empty crops get no species
+def identify_species_batch(crops):
+    out = [(None, None, 0.0)] * len(crops)
+    if scnd_model is None:
+        return out
+    valid = [i for i, c in enumerate(crops) if c is not None and c.size > 0]
+    with M.stage("species"):
+        futures = species_batcher.submit_many([crops[i] for i in valid])
+        for i, fut in zip(valid, futures):
+            out[i] = fut.result()
+    return out
+
+def identify_species(crop_bgr: np.ndarray):
+    return identify_species_batch([crop_bgr])[0]
+
+# the first model result -> plants with their container.
+# clamping, label normalization, the PLANT_MIN_CONF filter and the container matching are all
+# array operations, python dicts are only built for the plants that survived the filtering
+def detection_stage(res, w, h, container_min_conf=CONTAINER_MIN_CONF,
+                    container_topk=CONTAINER_TOPK, container_nms_iou=CONTAINER_NMS_IOU):
+    return detection_stage_arrays(res.names, *boxes_as_arrays(res), w, h,
+                                  container_min_conf, container_topk, container_nms_iou)
+
+# the same for boxes that are already arrays (merged tiles, boxes mapped back from a reduced decode)
+def detection_stage_arrays(names, xyxy, cls, conf, w, h, container_min_conf=CONTAINER_MIN_CONF,
+                           container_topk=CONTAINER_TOPK, container_nms_iou=CONTAINER_NMS_IOU):
+    M.observe("raw_boxes", len(cls))
+    boxes, valid = clamp_boxes(xyxy, w, h)
+    labels_n, is_plant, is_container = class_tables(names)
+
+    plant_idx = np.flatnonzero(valid & is_plant[cls] & (conf >= PLANT_MIN_CONF))
+    # containers only go through the candidate policy (by default it keeps all of them)
+    cont_idx  = filter_containers(np.flatnonzero(valid & is_container[cls]), boxes, cls, conf,
+                                  container_min_conf, container_topk, container_nms_iou)
+    best, best_iou = assign_containers(boxes[plant_idx], boxes[cont_idx])
+    M.observe("plants", len(plant_idx))
+    M.observe("containers", len(cont_idx))
+
+    plants = []
+    for i, b, score in zip(plant_idx.tolist(), best.tolist(), best_iou.tolist()):
+        c = int(cls[i])
+        if b >= 0:
+            container = canonical_container(labels_n[int(cls[cont_idx[b]])])  # pot / raised_bed / ground
+            container_score = score
+        else:
+            container, container_score = "unknown", 0.0
+        plants.append({
+            "label_raw": names[c],
+            "label_n": labels_n[c],
+            "confidence": float(conf[i]),
+            "coords": boxes[i].tolist(),
+            "container": container,
+            "container_score": container_score,
+        })
+    return plants
+
+### ------------------------- incremental re-analysis -------------------------------------- ###
+# a cheap appearance fingerprint of a crop - the 64 bit difference hash of its 9x8 thumbnail (structure)
+# and the mean color of the thumbnail (a plant that dried out keeps its shape but not its color).
+# 22 hex chars, "" for an empty crop
+def crop_fingerprint(crop):
+    if crop is None or crop.size == 0:
+        return ""
+    small = cv2.resize(crop, (9, 8), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    h = int(np.packbits(bits).view(">u8")[0])
+    b, g, r = (int(v) for v in small.reshape(-1, 3).mean(axis=0))
+    return f"{h:016x}{b:02x}{g:02x}{r:02x}"
+
+def fingerprints_match(a, b):
+    if len(a) != 22 or len(b) != 22:
+        return False
+    try:
+        dist = bin(int(a[:16], 16) ^ int(b[:16], 16)).count("1")
+        color = max(abs(x - y) for x, y in zip(bytes.fromhex(a[16:]), bytes.fromhex(b[16:])))
+    except ValueError:
+        return False
+    return dist <= REUSE_MAX_HASH_DIST and color <= REUSE_MAX_COLOR_DIFF
+
+# the "previous" field of /predict - a JSON list of earlier plant records of the same area:
+#   {"coords": [x1,y1,x2,y2], "fingerprint": "...", "species_label": "Basil" or null, "species_confidence": 0.93}
+# (what /predict returned for them). raises ValueError for anything else
+def parse_previous(text):
+    items = json.loads(text)
+    if not isinstance(items, list) or len(items) > PREVIOUS_MAX:
+        raise ValueError(f"previous must be a list of at most {PREVIOUS_MAX} plants")
+    out = []
+    for it in items:
+        coords = it.get("coords") if isinstance(it, dict) else None
+        if not isinstance(coords, list) or len(coords) != 4 or not all(isinstance(v, (int, float)) for v in coords):
+            raise ValueError("every previous plant needs coords [x1,y1,x2,y2]")
+        species = it.get("species_label")
+        conf = it.get("species_confidence", 0.0)
+        if (species is not None and not isinstance(species, str)) or not isinstance(conf, (int, float)):
+            raise ValueError("species_label must be a string or null and species_confidence a number")
+        out.append({"coords": coords, "fingerprint": str(it.get("fingerprint") or ""),
+                     "species": (species, norm_label(species) if species else None, float(conf))})
+    return out
+
+# the previous plant every new plant is the same as (None - a new or changed plant).
+# boxes are paired one to one, best IoU first, and a pair only counts when the crops also look the same
+def match_previous(plants, fingerprints, previous):
+    found = [None] * len(plants)
+    if not plants or not previous:
+        return found
+    m = iou_matrix(np.array([p["coords"] for p in plants], dtype=np.float64),
+                   np.array([q["coords"] for q in previous], dtype=np.float64))
+    used_new, used_prev = set(), set()
+    for flat in np.argsort(-m, axis=None, kind="stable"):
+        i, j = divmod(int(flat), m.shape[1])
+        if m[i, j] < REUSE_MIN_IOU:
+            break
+        if i in used_new or j in used_prev:
+            continue
+        used_new.add(i)
+        used_prev.add(j)
+        if fingerprints_match(fingerprints[i], previous[j]["fingerprint"]):
+            found[i] = previous[j]
+    return found
+
 ### ------------------------- server routes and functionality -------------------------------------- ###
 # this is the plant detection function
+# optional form field "previous" - the earlier detections of the same area (see parse_previous), unchanged
+# plants keep their species and carry "species_reused": true
 @app.post("/predict")
 def predict():
     req = request.files["image"]
-    img_bytes = np.frombuffer(req.read(), np.uint8)
-    img = cv2.imdecode(img_bytes, cv2.IMREAD_COLOR)
-    h, w = img.shape[:2]
+    raw = req.read()
+    mode = request.values.get("mode", "full")
+    if mode not in PREDICT_MODES:
+        return jsonify({"error": f"mode must be one of {PREDICT_MODES}"}), 400
+    previous = None
+    if request.values.get("previous"):
+        try:
+            previous = parse_previous(request.values["previous"])
+        except ValueError as e:
+            return jsonify({"error": f"previous: {e}"}), 400
 
-    # Keep everything from the model; we will filter plants only.
-    res = model.predict(img, conf=PRED_CONF_KEEP_ALL, verbose=False)[0]
-    names = res.names
+    # the same bytes were analyzed before - answer from the cache (a full run, nothing reused)
+    key = RC.content_key(raw)
+    if mode != "full":
+        image_store.put(key, raw)
+    cache_key = key if mode == "full" else f"{key}:{mode}"
+    # the perceptual match only makes sense for "full" - the other modes point at this exact upload.
+    # when it follows, the miss of the exact key is not counted (one miss per lookup)
+    phash = RESULT_CACHE_PHASH and result_cache.enabled and mode == "full"
+    cached = result_cache.get(cache_key, count_miss=not phash)
+    if cached is not None:
+        M.count("result_cache_hits")
+        return Response(cached, mimetype=response_mimetype(mode, key))
 
-    plants, containers = [], []
-    for xyxy, cls, conf in zip(res.boxes.xyxy.tolist(),
-                               res.boxes.cls.tolist(),
-                               res.boxes.conf.tolist()):
-        label_raw = names[int(cls)]
-        label_n   = norm_label(label_raw)
-        box = clamp(*xyxy, w, h)
-        if not box:
-            continue
+    with M.stage("decode"):
+        photo = IF.decode_photo(raw)
+    if photo is None:
+        if phash:
+            result_cache.miss()
+        return jsonify({"error": "image could not be decoded"}), 400
 
-        conf = float(conf)
-        rec  = {"label_raw": label_raw, "label_n": label_n, "confidence": conf, "coords": box}
+    pkey = None
+    if phash:
+        # the original size - a reduced decode has the same shape for a photo and its half size re-encode
+        pkey = RC.perceptual_key(photo.img, (photo.width, photo.height))
+        cached = result_cache.get(pkey)
+        if cached is not None:
+            M.count("result_cache_hits")
+            return Response(cached, mimetype="application/json")
 
-        if label_n in PLANT_CLASSES_N:
-            if conf < PLANT_MIN_CONF:    # plants threshold 0.70
-                continue
-            plants.append(rec)
+    out, crops = analyze(photo, crop_side(mode), previous)
+    with M.stage("render"):
+        body = render_predict(out, crops, mode, key)
+    # reused species are only as good as the client's data, they are not cached as the result of this photo
+    if not any(rec["species_reused"] for rec in out):
+        result_cache.put(cache_key, body, alias=pkey)
+    return Response(body, mimetype=response_mimetype(mode, key))
 
-        elif label_n in CONTAINER_CLASSES_N:
-            # no confidence filter for containers
-            containers.append(rec)
+# the boundary is derived from the image hash so a cached multipart body keeps a valid content type
+def multipart_boundary(key):
+    return f"plantcrops-{key[:24]}"
 
-    out = []
-    for p in plants:
-        best, best_iou = None, 0.0
-        for c in containers:
-            score = iou(p["coords"], c["coords"])
-            if score > best_iou:
-                best, best_iou = c, score
-
-        if best and best_iou >= MIN_IOU:
-            container = canonical_container(best["label_n"])  # pot / raised_bed / ground
-            container_score = best_iou
+def response_mimetype(mode, key):
+    if mode == "multipart":
+        return f"multipart/mixed; boundary={multipart_boundary(key)}"
+    return "application/json"
+
+# streaming variant of /predict - the client sees the boxes right after the first model and every
+# species as soon as its crop is classified, instead of waiting for the whole photo.
+#   format=ndjson (default) - one JSON object per line
+#   format=sse              - server-sent events, the record type is the event name
+# records: {"type": "summary", ...plants without species}, {"type": "plant", "idx": i, ...} per plant
+# in the order they finish, {"type": "done", "count": n}. mode=coords leaves the crops out like /predict
+@app.post("/predict_stream")
+def predict_stream():
+    raw = request.files["image"].read()
+    mode = request.values.get("mode", "full")
+    fmt = request.values.get("format", "ndjson")
+    if mode not in ("full", "coords") or fmt not in ("ndjson", "sse"):
+        return jsonify({"error": "mode must be full/coords and format ndjson/sse"}), 400
+    key = RC.content_key(raw)
+    if mode == "coords":
+        image_store.put(key, raw)
+    photo = IF.decode_photo(raw)
+    if photo is None:
+        return jsonify({"error": "image could not be decoded"}), 400
+
+    def line(rec):
+        data = app.json.dumps(rec, sort_keys=False, separators=(",", ":"))
+        if fmt == "sse":
+            return f"event: {rec['type']}\ndata: {data}\n\n"
+        return data + "\n"
+
+    def generate():
+        plants, crops, to_classify = detect_plants(photo, crop_side=crop_side(mode))
+        yield line({
+            "type": "summary", "width": photo.width, "height": photo.height, "plant_count": len(plants),
+            "plants": [{"idx": i, "label": p["label_raw"], "confidence": p["confidence"], "coords": p["coords"],
+                        "container": p["container"], "container_score": p["container_score"]}
+                       for i, p in enumerate(plants)],
+        })
+
+        def emit(i, species):
+            rec = {"type": "plant", "idx": i, **plant_record(plants[i], species, crop_fingerprint(crops[i]))}
+            if mode == "full":
+                rec["image"] = encode_b64(crops[i])
+            else:
+                add_crop_link(rec, key)
+            return line(rec)
+
+        # every crop is its own job on the species scheduler so they can be reported one by one,
+        # the plants that need no species model go out first
+        pending = {species_batcher.submit(tc): i for i, tc in enumerate(to_classify)
+                   if tc is not None and tc.size > 0 and scnd_model is not None}
+        waiting = set(pending.values())
+        for i, tc in enumerate(to_classify):
+            if i not in waiting:
+                yield emit(i, None if tc is None else (None, None, 0.0))
+        for fut in as_completed(pending):
+            yield emit(pending[fut], fut.result())
+        yield line({"type": "done", "count": len(plants)})
+
+    mimetype = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    resp = Response(stream_with_context(generate()), mimetype=mimetype)
+    # proxies must not buffer the stream
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+# decoding releases the GIL so the photos of one /predict_batch request are decoded side by side
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "4"))
+decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+
+def decode_image(raw):
+    return IF.decode_photo(raw)
+
+# many photos in one request, e.g. re-analyzing every photo slot of an area or a backfill.
+# multipart: "images" (repeated) and optionally "ids" (repeated, same order - default is the file name),
+# mode=full|coords like /predict. the photos are decoded in parallel, detected in batches and all the
+# species crops of all the photos go to the species model together.
+# response: {"results": {id: [plants like /predict]}, "errors": {id: message}}
+@app.post("/predict_batch")
+def predict_batch():
+    files = request.files.getlist("images")
+    mode = request.values.get("mode", "full")
+    if not files:
+        return jsonify({"error": "at least one file in 'images' is required"}), 400
+    if mode not in ("full", "coords"):
+        return jsonify({"error": "mode must be full or coords"}), 400
+    ids = request.form.getlist("ids") or [f.filename or str(i) for i, f in enumerate(files)]
+    if len(ids) != len(files) or len(set(ids)) != len(ids):
+        return jsonify({"error": "'ids' must be unique and match the number of images"}), 400
+
+    raws = [f.read() for f in files]
+    keys = [RC.content_key(raw) for raw in raws]
+    bodies, errors = {}, {}
+
+    # photos answered by the cache skip everything else
+    todo = []
+    for i, (raw, key) in enumerate(zip(raws, keys)):
+        if mode != "full":
+            image_store.put(key, raw)
+        cached = result_cache.get(key if mode == "full" else f"{key}:{mode}")
+        if cached is not None:
+            bodies[ids[i]] = cached
         else:
-            container, container_score = "unknown", 0.0
+            todo.append(i)
+
+    photos = list(decode_pool.map(decode_image, [raws[i] for i in todo]))
+    decoded = []
+    for i, photo in zip(todo, photos):
+        if photo is None:
+            errors[ids[i]] = "image could not be decoded"
+        else:
+            decoded.append((i, photo))
+
+    # detection - every photo (and its tiles) is queued first, the scheduler runs them in batches of DETECT_BATCH_MAX
+    jobs = [submit_detection(photo.img) for _, photo in decoded]
+    per_image = [detect_plants(photo, collect_detection(job), crop_side(mode)) for (_, photo), job in zip(decoded, jobs)]
+
+    # species - every crop of every photo in one go
+    all_to_classify = [tc for _, _, to_classify in per_image for tc in to_classify]
+    all_species = iter(identify_species_batch(all_to_classify))
+
+    for (i, _), (plants, crops, to_classify) in zip(decoded, per_image):
+        out = []
+        for p, tc, crop in zip(plants, to_classify, crops):
+            sp = next(all_species)
+            out.append(plant_record(p, None if tc is None else sp, crop_fingerprint(crop)))
+        cache_key = keys[i] if mode == "full" else f"{keys[i]}:{mode}"
+        body = render_predict(out, crops, mode, keys[i])
+        result_cache.put(cache_key, body)
+        bodies[ids[i]] = body
+
+    # the per photo bodies are already JSON, they are joined as they are instead of parsed again
+    dumps = lambda obj: app.json.dumps(obj).encode("utf-8")
+    results = b",".join(dumps(k) + b":" + bodies[k] for k in ids if k in bodies)
+    body = b'{"results":{' + results + b'},"errors":' + dumps(errors) + b"}"
+    return Response(body, mimetype="application/json")
+
+# the same compact encoding jsonify() produces
+def json_bytes(obj):
+    return app.json.response(obj).get_data()
+
+# where a client fetches the crop of a plant lazily (see /crop)
+def add_crop_link(rec, key):
+    x1, y1, x2, y2 = rec["coords"]
+    rec["image_id"] = key
+    rec["crop_url"] = f"/crop?image_id={key}&coords={x1},{y1},{x2},{y2}"
 
-        x1,y1,x2,y2 = p["coords"]
-        crop = img[y1:y2, x1:x2]
-        
+# turning the analysis of one photo into the response body of the requested mode
+def render_predict(out, crops, mode, key):
+    if mode == "full":
+        for rec, crop in zip(out, crops):
+            rec["image"] = encode_b64(crop)
+        return json_bytes(out)
+
+    for rec in out:
+        add_crop_link(rec, key)
+    if mode == "coords":
+        return json_bytes(out)
+
+    # multipart - no base64, the JPEG bytes travel as they are
+    boundary = multipart_boundary(key).encode("ascii")
+    for i, rec in enumerate(out):
+        rec["part"] = f"plant-{i}"
+    parts = [b"Content-Type: application/json\r\n\r\n" + json_bytes(out)]
+    for rec, crop in zip(out, crops):
+        parts.append(f"Content-Type: image/jpeg\r\nContent-ID: <{rec['part']}>\r\n\r\n".encode("ascii") + encode_jpeg(crop))
+    body = b"".join(b"--" + boundary + b"\r\n" + p + b"\r\n" for p in parts)
+    return body + b"--" + boundary + b"--\r\n"
+
+# the last photos /crop cut from stay decoded, clients usually fetch all crops of one photo in a row.
+# an LRU bounded by CROP_DECODED_MB of pixels
+_decoded = OrderedDict()
+_decoded_bytes = 0
+_decoded_lock = threading.Lock()
+
+def _decoded_from_store(key):
+    global _decoded_bytes
+    with _decoded_lock:
+        img = _decoded.get(key)
+        if img is not None:
+            _decoded.move_to_end(key)
+            return img
+    raw = image_store.get(key)
+    if raw is None:
+        raise KeyError(key)
+    img = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+    max_bytes = int(CROP_DECODED_MB * 1024 * 1024)
+    if img is None or img.nbytes > max_bytes:
+        return img
+    with _decoded_lock:
+        if key not in _decoded:
+            _decoded[key] = img
+            _decoded_bytes += img.nbytes
+            while _decoded_bytes > max_bytes:
+                _, old = _decoded.popitem(last=False)
+                _decoded_bytes -= old.nbytes
+    return img
+
+# an optional integer query parameter clamped to bounds (None when missing), ValueError when not a number
+def int_param(name, bounds):
+    value = request.values.get(name)
+    if value is None or value == "":
+        return None
+    return max(bounds[0], min(int(value), bounds[1]))
+
+# lazy crop delivery for the "coords" mode.
+#   GET  /crop?image_id=<id>&coords=x1,y1,x2,y2   - cut from an upload kept by /predict
+#   POST /crop  (multipart: image, coords)        - cut from the uploaded image itself
+# quality (1-100) / max_side (16-8192) override the CROP_JPEG_QUALITY / CROP_MAX_SIDE defaults,
+# values outside the range are clamped to it
+@app.route("/crop", methods=["GET", "POST"])
+def crop():
+    try:
+        x1, y1, x2, y2 = (int(v) for v in request.values.get("coords", "").split(","))
+    except ValueError:
+        return jsonify({"error": "coords must be x1,y1,x2,y2"}), 400
+    try:
+        quality = int_param("quality", CROP_QUALITY_RANGE)
+        max_side = int_param("max_side", CROP_SIDE_RANGE)
+    except ValueError:
+        return jsonify({"error": "quality and max_side must be integers"}), 400
+
+    if "image" in request.files:
+        img = cv2.imdecode(np.frombuffer(request.files["image"].read(), np.uint8), cv2.IMREAD_COLOR)
+    else:
+        image_id = request.values.get("image_id", "")
+        if not RC.CONTENT_KEY.fullmatch(image_id):
+            return jsonify({"error": "image_id must be the 64 hex chars returned by /predict"}), 400
+        try:
+            img = _decoded_from_store(image_id)
+        except KeyError:
+            return jsonify({"error": "image_not_found", "message": "upload the image with POST /crop"}), 404
+    if img is None:
+        return jsonify({"error": "image could not be decoded"}), 400
+
+    h, w = img.shape[:2]
+    box = clamp(x1, y1, x2, y2, w, h)
+    if not box:
+        return jsonify({"error": "coords are outside the image"}), 400
+    x1, y1, x2, y2 = box
+    data = encode_jpeg(img[y1:y2, x1:x2], quality, max_side)
+    resp = Response(data, mimetype="image/jpeg")
+    resp.headers["Cache-Control"] = "private, max-age=900"
+    return resp
+
+# one image to the detector - the whole image and, when it is tiled (see image_frontend.tiles_for), every
+# tile as its own job on the scheduler so they share batches with other requests
+def submit_detection(img):
+    h, w = img.shape[:2]
+    tiles = IF.tiles_for(w, h)
+    futures = detect_batcher.submit_many([img] + [img[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles])
+    return futures, tiles, (w, h)
+
+# the boxes of a submitted image (names, xyxy, cls, conf) in its pixels, the boxes of the tiles are
+# moved to their place in the image and merged with the boxes of the whole image. only boxes above the
+# plant / container confidence floors take part, a faint box the detector returns at DETECT_CONF must
+# not decide which boxes belong together
+def collect_detection(job):
+    futures, tiles, (w, h) = job
+    res = futures[0].result()
+    if not tiles:
+        return (res.names, *boxes_as_arrays(res))
+    xyxy, cls, conf = boxes_as_arrays(res)
+    parts = [(xyxy, cls, conf, np.full(len(cls), -1), np.zeros(len(cls), dtype=bool))]
+    for t, (tile, fut) in enumerate(zip(tiles, futures[1:])):
+        xyxy, cls, conf = boxes_as_arrays(fut.result())
+        xyxy = xyxy + np.array([tile[0], tile[1], tile[0], tile[1]], dtype=xyxy.dtype)
+        parts.append((xyxy, cls, conf, np.full(len(cls), t), IF.cut_at_seam(xyxy, tile, w, h)))
+    M.observe("tiles", len(tiles))
+    xyxy, cls, conf, src, cut = (np.concatenate(p) for p in zip(*parts))
+    _, is_plant, is_container = class_tables(res.names)
+    confident = np.flatnonzero((is_plant[cls] & (conf >= PLANT_MIN_CONF)) | (is_container[cls] & (conf >= CONTAINER_MIN_CONF)))
+    return (res.names, *IF.merge_boxes(xyxy[confident], cls[confident], conf[confident], src[confident], cut[confident]))
+
+# how many pixels the crops of a response mode need - the species model letterboxes to SCND_IMGSZ, the
+# returned crops are full size unless CROP_MAX_SIDE caps them (None - cut from the full resolution)
+def crop_side(mode):
+    if mode == "coords":
+        return SCND_IMGSZ
+    return max(SCND_IMGSZ, CROP_MAX_SIDE) if CROP_MAX_SIDE > 0 else None
+
+# the first model over one decoded photo (det - an already collected detection) -> the plants with their container, the crop of every plant
+# and the crops that still need the species model (None for a cactus, it skips the species model).
+# the coordinates are in the pixels of the original photo, a crop comes from the reduced decode only
+# when it has at least side pixels there
+def detect_plants(photo, det=None, crop_side=None):
+    # Keep everything from the model; we will filter plants only.
+    if det is None:
+        with M.stage("detect"):
+            det = collect_detection(submit_detection(photo.img))
+    names, xyxy, cls, conf = det
+    with M.stage("detection_stage"):
+        plants = detection_stage_arrays(names, photo.to_original(xyxy), cls, conf, photo.width, photo.height)
+
+    crops, to_classify = [], []
+    for p in plants:
+        crop = photo.crop(p["coords"], crop_side)
+        crops.append(crop)
         lbl_n = p.get("label_n") or norm_label(p.get("label", ""))
+        to_classify.append(None if lbl_n == "cactus" else crop)
+    return plants, crops, to_classify
 
-        if lbl_n == "cactus":
+# one plant of the /predict response, fingerprint - the crop_fingerprint of its crop
+def plant_record(p, species, fingerprint="", reused=False):
+    if species is None:
     # skip the species model and hard-set species as cactus
-            species_raw, species_n, species_conf = "Cactus", "cactus", 1.0  # or 0.0 if you prefer
-        else:
-            species_raw, species_n, species_conf = identify_species(crop)
-        out_label = species_raw or p["label_raw"]
-        out.append({
-            # primary plant detection
-            "label": out_label,
-            "confidence": p["confidence"],
-            "coords": p["coords"],
-            "image": encode_b64(crop),
-            "container": container,
-            "container_score": container_score,
-            # secondary species classification
-            "species_label": species_raw,
-            "species_label_n": species_n,
-            "species_confidence": species_conf
-        })
+        species_raw, species_n, species_conf = "Cactus", "cactus", 1.0  # or 0.0 if you prefer
+    else:
+        species_raw, species_n, species_conf = species
+    out_label = species_raw or p["label_raw"]
+    return {
+        # primary plant detection
+        "label": out_label,
+        "confidence": p["confidence"],
+        "coords": p["coords"],
+        "container": p["container"],
+        "container_score": p["container_score"],
+        # secondary species classification
+        "species_label": species_raw,
+        "species_label_n": species_n,
+        "species_confidence": species_conf,
+        # incremental re-analysis - send these back as "previous" with the next photo of the area
+        "fingerprint": fingerprint,
+        "species_reused": reused,
+    }
 
-    return jsonify(out)
+# both models over one decoded photo -> the list of plant records /predict returns and the crop of every plant.
+# with previous detections the unchanged plants take their species from there and skip the second model
+def analyze(photo, side=None, previous=None):
+    plants, crops, to_classify = detect_plants(photo, crop_side=side)
+    fingerprints = [crop_fingerprint(c) for c in crops]
+    same = match_previous(plants, fingerprints, previous)
+    # all the species of the photo that still need the model are classified in one batch
+    species = identify_species_batch([None if q is not None else tc for tc, q in zip(to_classify, same)])
+    out = []
+    for p, tc, sp, q, fp in zip(plants, to_classify, species, same, fingerprints):
+        reused = tc is not None and q is not None
+        out.append(plant_record(p, None if tc is None else (q["species"] if reused else sp), fp, reused))
+    M.count("species_reused", sum(rec["species_reused"] for rec in out))
+    return out, crops
+
+# scheduler statistics - queue depth and batch size histograms of both models, cache hit/miss counters,
+# forecast cache hit rate and upstream latency
+@app.get("/stats")
+def stats():
+    return jsonify({
+        "detect": detect_batcher.stats(),
+        "species": species_batcher.stats(),
+        "result_cache": result_cache.stats(),
+        "weather": weather_api().weather_stats(),
+        "startup": startup,
+    })
+
+# liveness - the process answers. it fails only when loading the models failed, a restart may fix that
+@app.get("/healthz")
+def healthz():
+    if startup["error"]:
+        return jsonify({"status": "failed", "error": startup["error"]}), 500
+    return jsonify({"status": "ok"})
+
+# readiness - both models are loaded and warmed up, with the cold start timings
+@app.get("/readyz")
+def readyz():
+    if not models_ready.is_set():
+        resp = jsonify({"ready": False, "startup": startup})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(PY_RETRY_AFTER_S)
+        return resp
+    return jsonify({"ready": True, "startup": startup})
+
+# Prometheus scrape endpoint - stage latency histograms, per request object counts and counters (see metrics.py)
+@app.get("/metrics")
+def metrics():
+    return Response(M.render(), mimetype="text/plain; version=0.0.4")
 
 # this is the weather method
+# optional body keys: "compact": true and/or "fields": [...] select a lean output (see weatherAPI.start)
 @app.route("/weather", methods=["POST"])
 def weather():
+    WAPI = weather_api()
     data = request.get_json()  # parse JSON body
     lat = data.get("latitude")
     lon = data.get("longitude")
     weather_string = str(lat) + "," + str(lon)
-    weatherJSON = WAPI.start(weather_string,0)
-    return weatherJSON
+    fields = data.get("fields")
+    if fields is not None and (not isinstance(fields, list) or not all(f in WAPI.WEATHER_SECTIONS for f in fields)):
+        return jsonify({"error": f"fields must be a list of {list(WAPI.WEATHER_SECTIONS)}"}), 400
+    weatherJSON = WAPI.start(weather_string, 0, fields=fields, compact=bool(data.get("compact")))
+    return Response(weatherJSON, mimetype="application/json")
+
+# batch geocoding - {"locations": ["Haifa", ...]} -> {"results": {"Haifa": {"latitude":..,"longitude":..} or null}}.
+# known places come from the cache, new ones are looked up one after the other within the nominatim rate limit
+GEOCODE_BATCH_MAX = int(os.getenv("GEOCODE_BATCH_MAX", "50"))
+
+@app.route("/geocode", methods=["POST"])
+def geocode():
+    data = request.get_json(silent=True) or {}
+    names = data.get("locations")
+    if not isinstance(names, list) or not names or not all(isinstance(n, str) and n.strip() for n in names):
+        return jsonify({"error": "locations must be a non empty list of names"}), 400
+    if len(names) > GEOCODE_BATCH_MAX:
+        return jsonify({"error": f"at most {GEOCODE_BATCH_MAX} locations per request"}), 400
+    found = weather_api().get_coordinates_many(names)
+    return jsonify({"results": {n: None if c is None else {"latitude": c[0], "longitude": c[1]} for n, c in found.items()}})
 
 # configuration of the server itself
 if __name__ == "__main__":
-    import os
     port = int(os.getenv("PY_PORT", "2021"))
+    mark_listening()
     app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
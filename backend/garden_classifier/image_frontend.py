@@ -0,0 +1,186 @@
+# image_frontend.py
+# turning an uploaded photo into what the detector needs, without paying for pixels nobody looks at.
+#   reduced decode - the detector letterboxes to its input size anyway, so a JPEG larger than
+#                    DECODE_MAX_SIDE is decoded at 1/2, 1/4 or 1/8 scale straight by libjpeg (the DCT
+#                    scaling of cv2.IMREAD_REDUCED_*), the size is read from the file header first
+#   full source    - crops are cut from the reduced image when it still has enough pixels for them,
+#                    otherwise the photo is decoded at full resolution once, lazily
+#   tiling         - a large photo is also cut into overlapping tiles so small plants keep enough pixels
+#                    after the detector's downscale, the confident boxes of all tiles and of the whole
+#                    photo are merged again (see merge_boxes)
+# every coordinate that leaves this module is in the pixels of the original (EXIF rotated) photo.
+
+import math
+import os
+import struct
+
+import cv2
+import numpy as np
+
+DECODE_MAX_SIDE = int(os.getenv("DECODE_MAX_SIDE", "0"))      # 0 = always decode at full resolution
+TILE_MODE       = os.getenv("TILE_MODE", "off").lower()       # off | auto | on
+TILE_SIZE       = int(os.getenv("TILE_SIZE", "1280"))         # tile side in pixels of the decoded image
+TILE_OVERLAP    = float(os.getenv("TILE_OVERLAP", "0.2"))
+TILE_MIN_SIDE   = int(os.getenv("TILE_MIN_SIDE", "2560"))     # auto: only photos with a longer side are tiled
+TILE_MERGE_IOS  = float(os.getenv("TILE_MERGE_IOS", "0.6"))   # a seam cut box this much inside a kept box is dropped
+TILE_MERGE_IOU  = float(os.getenv("TILE_MERGE_IOU", "0.5"))   # boxes of two tiles overlapping this much are one plant
+TILE_EDGE_PX    = 2                                           # a box this close to a tile's inner edge was cut by it
+
+TILE_MODES = ("off", "auto", "on")
+REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+# start of frame markers of baseline, progressive, lossless and arithmetic JPEGs
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+### ---- header ---- ###
+# (format, width, height) from the first bytes of the file, None when the format is not known.
+# the size is the stored one - before the EXIF orientation is applied
+def image_size(data):
+    if data[:3] == b"\xff\xd8\xff":
+        i, n = 2, len(data)
+        while i + 9 < n:
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:   # fill byte
+                i += 1
+                continue
+            if marker in JPEG_SOF:
+                h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                return "jpeg", w, h
+            if marker == 0xDA:   # start of scan, no frame header before it
+                return None
+            i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+        return None
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        w, h = struct.unpack(">II", data[16:24])
+        return "png", w, h
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            w, h = struct.unpack("<HH", data[26:30])
+            return "webp", w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L":
+            b = struct.unpack("<I", data[21:25])[0]
+            return "webp", (b & 0x3FFF) + 1, ((b >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return "webp", int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None
+
+# the largest libjpeg scale that keeps the longer side at or above max_side (1 = full size)
+def reduction_factor(w, h, max_side):
+    if max_side <= 0:
+        return 1
+    for f in (8, 4, 2):
+        if math.ceil(max(w, h) / f) >= max_side:
+            return f
+    return 1
+
+### ---- decode ---- ###
+class Photo:
+    __slots__ = ("raw", "img", "width", "height", "sx", "sy", "reduced", "_full")
+
+    def __init__(self, raw, img, width, height):
+        self.raw = raw
+        self.img = img                         # the image the detector sees
+        self.width, self.height = width, height
+        self.sx = width / img.shape[1]         # original pixels per decoded pixel
+        self.sy = height / img.shape[0]
+        self.reduced = (self.sx, self.sy) != (1.0, 1.0)
+        self._full = None if self.reduced else img
+
+    # the full resolution image, decoded on first use
+    def full(self):
+        if self._full is None:
+            self._full = cv2.imdecode(np.frombuffer(self.raw, np.uint8), cv2.IMREAD_COLOR)
+        return self._full
+
+    # boxes of the decoded image -> boxes in original pixels
+    def to_original(self, xyxy):
+        if not self.reduced:
+            return xyxy
+        return xyxy * np.array([self.sx, self.sy, self.sx, self.sy], dtype=np.float32)
+
+    # the crop of an original pixel box. it comes from the decoded image when its longer side there is
+    # at least min_side pixels (None - only the full resolution will do), otherwise from the full image
+    def crop(self, box, min_side=None):
+        x1, y1, x2, y2 = box
+        if self.reduced and min_side is not None:
+            rx1, ry1 = int(x1 / self.sx), int(y1 / self.sy)
+            rx2, ry2 = math.ceil(x2 / self.sx), math.ceil(y2 / self.sy)
+            if max(rx2 - rx1, ry2 - ry1) >= min_side:
+                return self.img[ry1:ry2, rx1:rx2]
+        return self.full()[y1:y2, x1:x2]
+
+# the uploaded bytes -> Photo (None if they are not an image). only JPEGs are decoded reduced,
+# opencv decodes every other format at full size and resizes it afterwards, which saves nothing
+def decode_photo(raw, max_side=DECODE_MAX_SIDE):
+    size = image_size(raw) if max_side > 0 else None
+    f = reduction_factor(size[1], size[2], max_side) if size and size[0] == "jpeg" else 1
+    img = cv2.imdecode(np.frombuffer(raw, np.uint8), REDUCED_FLAGS[f] if f > 1 else cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    if f == 1:
+        return Photo(raw, img, img.shape[1], img.shape[0])
+    # the decoder applied the EXIF orientation - a rotated photo comes back with width and height swapped
+    _, w, h = size
+    rh, rw = img.shape[:2]
+    if (rw, rh) != (math.ceil(w / f), math.ceil(h / f)):
+        w, h = h, w
+    return Photo(raw, img, w, h)
+
+### ---- tiling ---- ###
+# tile rectangles (x0, y0, x1, y1) covering a w x h image, [] when it should not be tiled
+def tiles_for(w, h, mode=TILE_MODE, size=TILE_SIZE, overlap=TILE_OVERLAP, min_side=TILE_MIN_SIDE):
+    if mode == "off" or max(w, h) <= size or (mode == "auto" and max(w, h) < min_side):
+        return []
+    stride = max(1, int(size * (1.0 - overlap)))
+
+    def starts(length):
+        if length <= size:
+            return [0]
+        out = list(range(0, length - size + 1, stride))
+        if out[-1] + size < length:
+            out.append(length - size)
+        return out
+
+    return [(x0, y0, min(x0 + size, w), min(y0 + size, h)) for y0 in starts(h) for x0 in starts(w)]
+
+# the boxes of a tile that end at one of its inner edges (an edge inside the photo, not its border) -
+# the plants the seam cut. xyxy in photo pixels, tile = (x0, y0, x1, y1), w x h the photo
+def cut_at_seam(xyxy, tile, w, h, margin=TILE_EDGE_PX):
+    x0, y0, x1, y1 = tile
+    return (((xyxy[:, 0] <= x0 + margin) & (x0 > 0)) | ((xyxy[:, 1] <= y0 + margin) & (y0 > 0)) |
+            ((xyxy[:, 2] >= x1 - margin) & (x1 < w)) | ((xyxy[:, 3] >= y1 - margin) & (y1 < h)))
+
+# merging the boxes of the tiles and of the whole photo (src - where a box comes from, -1 the whole photo
+# or the tile index, cut - see cut_at_seam). boxes of one source already went through the detector's
+# NMS, so only boxes of the same class from different sources are compared. score ordered, every kept
+# box keeps its own extent and drops
+#   - a duplicate, IoU of at least nms_iou (a plant inside the overlap of two tiles)
+#   - a fragment, a box cut by a seam that lies inside the kept box by min_ios of its own area
+# whole boxes go first, so a confident fragment does not win over the plant it was cut from
+def merge_boxes(xyxy, cls, conf, src, cut, min_ios=TILE_MERGE_IOS, nms_iou=TILE_MERGE_IOU):
+    n = len(conf)
+    if n == 0:
+        return xyxy, cls, conf
+    area = np.maximum(0, xyxy[:, 2] - xyxy[:, 0]) * np.maximum(0, xyxy[:, 3] - xyxy[:, 1])
+    used = np.zeros(n, dtype=bool)
+    keep = []
+    for i in np.lexsort((-conf, cut)):
+        if used[i]:
+            continue
+        used[i] = True
+        keep.append(i)
+        rest = np.flatnonzero(~used & (cls == cls[i]) & (src != src[i]))
+        if len(rest) == 0:
+            continue
+        iw = np.clip(np.minimum(xyxy[rest, 2], xyxy[i, 2]) - np.maximum(xyxy[rest, 0], xyxy[i, 0]), 0, None)
+        ih = np.clip(np.minimum(xyxy[rest, 3], xyxy[i, 3]) - np.maximum(xyxy[rest, 1], xyxy[i, 1]), 0, None)
+        inter = iw * ih
+        iou = inter / np.maximum(area[rest] + area[i] - inter, 1e-9)
+        fragment = cut[rest] & (inter / np.maximum(area[rest], 1e-9) >= min_ios)
+        used[rest[(iou >= nms_iou) | fragment]] = True
+    # best score first, the order YOLO returns its boxes in
+    keep = np.array(keep, dtype=np.int64)
+    keep = keep[np.argsort(-conf[keep], kind="stable")]
+    return xyxy[keep], cls[keep], conf[keep]
@@ -0,0 +1,99 @@
+# inference_backend.py
+# loading the YOLO models through a selectable runtime.
+# torch runs the .pt weights eagerly, onnx and openvino export the weights once into EXPORT_DIR
+# and load the exported graph - ultralytics wraps every format with the same YOLO object so
+# predict(), res.names and res.boxes stay exactly the same for the rest of the server.
+#
+# INFERENCE_BACKEND = torch | onnx | openvino
+# INFERENCE_INT8    = 1 quantizes the exported model (onnx - dynamic quantization, openvino - NNCF
+#                     calibration on INFERENCE_INT8_DATA, a dataset yaml)
+#
+# ultralytics (and torch behind it) is imported by the first load_model call, not with this module,
+# so a server loading its models in the background can start listening first
+
+import hashlib
+import os
+import shutil
+
+import numpy as np
+
+INFERENCE_BACKEND   = os.getenv("INFERENCE_BACKEND", "torch").lower()
+INFERENCE_INT8      = os.getenv("INFERENCE_INT8", "0") == "1"
+INFERENCE_INT8_DATA = os.getenv("INFERENCE_INT8_DATA", "")
+EXPORT_DIR          = os.getenv("EXPORT_DIR", "/app/.exports")
+WARMUP_RUNS         = int(os.getenv("WARMUP_RUNS", "1"))
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+# the exports of one weights file live in a folder named after its size and mtime,
+# replacing the .pt file therefore triggers a new export instead of loading an old graph
+def _export_folder(pt_path, backend, imgsz, int8):
+    st = os.stat(pt_path)
+    tag = f"{os.path.abspath(pt_path)}|{st.st_size}|{int(st.st_mtime)}|{backend}|{imgsz}|{int8}"
+    digest = hashlib.sha256(tag.encode("utf-8")).hexdigest()[:12]
+    stem = os.path.splitext(os.path.basename(pt_path))[0]
+    return os.path.join(EXPORT_DIR, f"{stem}_{backend}{'_int8' if int8 else ''}_{digest}")
+
+# onnx has no int8 export in ultralytics, the float graph is quantized with onnxruntime instead.
+# the ultralytics metadata (class names, imgsz, task) is copied over so YOLO can still read it
+def _quantize_onnx(onnx_path):
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    out = onnx_path.replace(".onnx", "_int8.onnx")
+    if not os.path.exists(out):
+        quantize_dynamic(onnx_path, out, weight_type=QuantType.QUInt8)
+        src, dst = onnx.load(onnx_path), onnx.load(out)
+        del dst.metadata_props[:]
+        dst.metadata_props.extend(src.metadata_props)
+        onnx.save(dst, out)
+    return out
+
+# exporting the .pt once, later starts find the exported model in the folder and skip the export.
+# the models folder is mounted read only so the weights are copied next to the export first
+def export_model(pt_path, backend, imgsz=None, int8=False):
+    folder = _export_folder(pt_path, backend, imgsz, int8)
+    marker = os.path.join(folder, "exported_path.txt")
+    if os.path.exists(marker):
+        with open(marker, encoding="utf-8") as f:
+            path = f.read().strip()
+        if os.path.exists(path):
+            return path
+    os.makedirs(folder, exist_ok=True)
+    local_pt = os.path.join(folder, os.path.basename(pt_path))
+    if not os.path.exists(local_pt):
+        shutil.copy2(pt_path, local_pt)
+
+    from ultralytics import YOLO
+    pt_model = YOLO(local_pt, task="detect")
+    # without an explicit size the graph is exported at the size the model was trained on
+    kwargs = {"format": backend, "imgsz": imgsz or pt_model.overrides.get("imgsz", 640), "dynamic": True}
+    if backend == "openvino" and int8:
+        kwargs["int8"] = True
+        if INFERENCE_INT8_DATA:
+            kwargs["data"] = INFERENCE_INT8_DATA
+    path = str(pt_model.export(**kwargs))
+    if backend == "onnx" and int8:
+        path = _quantize_onnx(path)
+
+    with open(marker, "w", encoding="utf-8") as f:
+        f.write(path)
+    return path
+
+def load_model(pt_path, backend=INFERENCE_BACKEND, imgsz=None, int8=INFERENCE_INT8):
+    if backend not in BACKENDS:
+        raise ValueError(f"INFERENCE_BACKEND must be one of {BACKENDS}, got '{backend}'")
+    from ultralytics import YOLO
+    if backend == "torch":
+        return YOLO(pt_path, task="detect")
+    return YOLO(export_model(pt_path, backend, imgsz, int8), task="detect")
+
+# a few dummy inferences at the batch size the server will use, so graph initialization,
+# memory allocation and kernel selection happen at startup instead of on the first real request.
+# imgsz is only passed on when the server also passes it to predict() for that model
+def warmup(model, batch=1, size=640, imgsz=None, runs=WARMUP_RUNS, conf=0.25):
+    if model is None or runs <= 0:
+        return
+    dummy = [np.full((size, size, 3), 114, dtype=np.uint8) for _ in range(max(1, batch))]
+    kwargs = {"imgsz": imgsz} if imgsz else {}
+    for _ in range(runs):
+        model.predict(dummy, conf=conf, verbose=False, **kwargs)
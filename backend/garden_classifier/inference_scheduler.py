@@ -0,0 +1,125 @@
+# inference_scheduler.py
+# a small dynamic micro-batching scheduler that sits in front of a model.
+# request threads submit single items and get a Future back, one worker thread groups whatever
+# arrived within a short window (or until the batch is full) and runs a single batched call.
+# this keeps the cores busy under concurrent uploads instead of running many tiny inferences.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# upper bounds (inclusive) of the batch size histogram buckets
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class MicroBatcher:
+    # name      - used in the stats output
+    # batch_fn  - receives a list of items and must return a list of results in the same order
+    # max_batch - the largest batch handed to batch_fn
+    # max_wait  - how long (seconds) the first item of a batch waits for company
+    def __init__(self, name, batch_fn, max_batch=8, max_wait=0.01):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        # statistics
+        self._hist = {b: 0 for b in BATCH_BUCKETS}
+        self._hist_over = 0
+        self._batches = 0
+        self._items = 0
+        self._max_depth = 0
+
+    # the worker thread is started lazily and restarted after a fork, threads do not survive fork()
+    # so a scheduler created before the server forks its workers must start again in every child
+    def _ensure_worker(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+            self._thread.start()
+
+    def submit(self, item):
+        self._ensure_worker()
+        fut = Future()
+        self._queue.put((item, fut))
+        depth = self._queue.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+        return fut
+
+    def submit_many(self, items):
+        return [self.submit(item) for item in items]
+
+    # blocking helper for callers that just want the results
+    def run(self, items):
+        return [f.result() for f in self.submit_many(items)]
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # take whatever is already waiting without sleeping
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _record(self, size):
+        with self._lock:
+            self._batches += 1
+            self._items += size
+            for b in BATCH_BUCKETS:
+                if size <= b:
+                    self._hist[b] += 1
+                    break
+            else:
+                self._hist_over += 1
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            self._record(len(items))
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+    def stats(self):
+        with self._lock:
+            hist = {f"<={b}": n for b, n in self._hist.items()}
+            hist[f">{BATCH_BUCKETS[-1]}"] = self._hist_over
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_depth,
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "batch_size_histogram": hist,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
@@ -0,0 +1,199 @@
+# metrics.py
+# low overhead hot-path instrumentation for the pyserver, served in the Prometheus text format.
+#   with stage("decode"): ...       - seconds of one stage into pyserver_stage_seconds{stage="decode"}
+#   observe("plants", n)            - a per-request size (plants, containers, raw boxes) into a histogram
+#   count("result_cache_hits")      - a plain counter
+# a timer costs two perf_counter calls and one locked update. under gunicorn every worker keeps its own
+# numbers - with METRICS_DIR set each worker writes them to a file there (at most once per second) and
+# /metrics on any worker sums the files of all workers, otherwise /metrics shows the answering worker.
+#
+# profiling a single request: with METRICS_PROFILE=1 a request carrying "X-Profile: 1" runs under cProfile,
+# the stats are written to PROFILE_DIR and the file name comes back in the X-Profile-File header.
+# cProfile sees the request thread only - the batched model calls run on the scheduler threads and show
+# up in the stage timers (detect_batch, species_batch) instead.
+
+import bisect
+import cProfile
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR     = os.getenv("METRICS_DIR", "")
+METRICS_PROFILE = os.getenv("METRICS_PROFILE", "0") == "1"
+PROFILE_DIR     = os.getenv("PROFILE_DIR", "/tmp/pyserver-profiles")
+PREFIX = "pyserver"
+
+# seconds - from a cache hit to a cold model on a slow cpu
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# objects per request
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 300)
+
+_lock = threading.Lock()
+# (metric, labels tuple) -> [bucket counts..., +Inf count, sum]
+_hists = {}
+_hist_buckets = {}
+_counters = {}
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+def _observe(metric, labels, value, buckets):
+    key = (metric, labels)
+    with _lock:
+        h = _hists.get(key)
+        if h is None:
+            h = _hists[key] = [0] * (len(buckets) + 2)
+            _hist_buckets[metric] = buckets
+        h[bisect.bisect_left(buckets, value)] += 1
+        h[-1] += value
+    _maybe_flush()
+
+@contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe("stage_seconds", (("stage", name),), time.perf_counter() - t0, TIME_BUCKETS)
+
+def timed(name):
+    def wrap(fn):
+        def inner(*a, **kw):
+            with stage(name):
+                return fn(*a, **kw)
+        inner.__name__ = fn.__name__
+        return inner
+    return wrap
+
+def observe_request(route, status, seconds):
+    _observe("request_seconds", (("route", route), ("status", str(status))), seconds, TIME_BUCKETS)
+
+def observe(name, value):
+    _observe(f"{name}_per_request", (), value, COUNT_BUCKETS)
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+### ---- export ---- ###
+def snapshot():
+    with _lock:
+        return {
+            "hists": [[m, list(l), list(h)] for (m, l), h in _hists.items()],
+            "buckets": {m: list(b) for m, b in _hist_buckets.items()},
+            "counters": dict(_counters),
+        }
+
+def _maybe_flush(force=False):
+    global _last_flush
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < 1.0:
+        return
+    # one writer at a time, a thread that finds the file busy leaves it to the next second
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _last_flush = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp, path)
+    finally:
+        _flush_lock.release()
+
+# the snapshots of every worker (or only this process) summed up
+def _merged():
+    if not METRICS_DIR:
+        return [snapshot()]
+    _maybe_flush(force=True)
+    snaps = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                snaps.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return snaps
+
+def _fmt_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+# the Prometheus text exposition format (version 0.0.4)
+def render():
+    hists, buckets, counters = {}, {}, {}
+    for snap in _merged():
+        buckets.update(snap["buckets"])
+        for m, labels, h in snap["hists"]:
+            key = (m, tuple(tuple(x) for x in labels))
+            acc = hists.setdefault(key, [0] * len(h))
+            for i, v in enumerate(h):
+                acc[i] += v
+        for name, v in snap["counters"].items():
+            counters[name] = counters.get(name, 0) + v
+
+    lines = []
+    for metric in sorted({m for m, _ in hists}):
+        full = f"{PREFIX}_{metric}"
+        lines.append(f"# TYPE {full} histogram")
+        bs = buckets[metric]
+        for (m, labels), h in sorted(hists.items()):
+            if m != metric:
+                continue
+            cum = 0
+            for le, n in zip(list(bs) + ["+Inf"], h[:-1]):
+                cum += n
+                lines.append(f"{full}_bucket{_fmt_labels(labels, ('le', le))} {cum}")
+            lines.append(f"{full}_sum{_fmt_labels(labels)} {h[-1]:.6f}")
+            lines.append(f"{full}_count{_fmt_labels(labels)} {cum}")
+    for name in sorted(counters):
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        lines.append(f"{PREFIX}_{name}_total {counters[name]}")
+    return "\n".join(lines) + "\n"
+
+### ---- flask hooks ---- ###
+_profile_lock = threading.Lock()
+
+# request timing for every route and the opt-in profiler, g holds the state of the request.
+# a streamed response is timed until its first byte, the generator runs after after_request
+def install(app):
+    from flask import g, request
+
+    @app.before_request
+    def _start():
+        g.metrics_t0 = time.perf_counter()
+        g.profiler = None
+        if METRICS_PROFILE and request.headers.get("X-Profile") == "1" and _profile_lock.acquire(blocking=False):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish(resp):
+        prof = g.pop("profiler", None)
+        if prof is not None:
+            prof.disable()
+            _profile_lock.release()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = f"{request.endpoint or 'unknown'}-{int(time.time() * 1000)}-{os.getpid()}.prof"
+            prof.dump_stats(os.path.join(PROFILE_DIR, name))
+            resp.headers["X-Profile-File"] = name
+        t0 = g.pop("metrics_t0", None)
+        if t0 is not None:
+            observe_request(request.endpoint or "unknown", resp.status_code, time.perf_counter() - t0)
+        return resp
+
+    # a request that failed before after_request must still stop its profiler
+    @app.teardown_request
+    def _teardown(exc):
+        prof = g.pop("profiler", None)
+        if prof is not None:
+            prof.disable()
+            _profile_lock.release()
@@ -0,0 +1,216 @@
+# result_cache.py
+# a content addressed cache for finished /predict responses.
+# the memory tier is an LRU bounded by size in MB with a TTL per entry, the optional disk tier
+# keeps the same entries as files so they survive a restart of the server.
+# every entry lives under a namespace - a fingerprint of the models and the thresholds - so changing
+# a model or a constant makes the old entries unreachable instead of serving stale detections.
+# a namespace folder carries a marker file with the kind of the cache, only folders of the same kind
+# are pruned, so another store (or anything else) in the same parent folder is left alone.
+
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+NAMESPACE_MARKER = ".cache_namespace"
+# a content key, and the only keys that become file names - a content key, optionally with a ":mode" suffix
+CONTENT_KEY = re.compile(r"[0-9a-f]{64}")
+DISK_KEY    = re.compile(r"[0-9a-f]{64}(:[a-z]+)?")
+
+# sha256 of the uploaded bytes - the exact key
+def content_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+# difference hash of the decoded image - the same photo re-encoded by a phone keeps the same hash.
+# the size is part of the key because the cached coordinates are only valid for the same resolution.
+# size - (width, height) of the original photo when img was decoded at a reduced scale
+def perceptual_key(img, size=None) -> str:
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    h = int(np.packbits(bits).view(">u8")[0])
+    w, ht = size or (img.shape[1], img.shape[0])
+    return f"p{h:016x}_{w}x{ht}"
+
+# a short stable hash of anything that changes the result (paths, model files, constants)
+def fingerprint(*parts) -> str:
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+# size and modification time of a file, so replacing the weights behind the same path also invalidates
+def file_signature(path):
+    try:
+        st = os.stat(path)
+        return (path, st.st_size, int(st.st_mtime))
+    except OSError:
+        return (path, None, None)
+
+class ResultCache:
+    # max_mb    - memory bound of the stored values (0 disables the cache)
+    # ttl       - seconds an entry is valid
+    # disk_dir  - optional folder for the disk tier
+    # namespace - fingerprint of the configuration
+    # kind      - what the cache holds, written to the marker of its namespace folder
+    def __init__(self, max_mb=64, ttl=3600, disk_dir=None, namespace="", kind="results"):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl = float(ttl)
+        self.namespace = namespace
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()     # key -> (expires_at, bytes)
+        self._alias = {}              # perceptual key -> content key
+        self._bytes = 0
+        self._puts_since_sweep = 0
+        self.counters = {"hits_memory": 0, "hits_disk": 0, "hits_perceptual": 0, "misses": 0, "puts": 0, "evictions": 0}
+        self.disk_dir = None
+        if disk_dir and self.enabled:
+            self.disk_dir = os.path.join(disk_dir, namespace or "default")
+            os.makedirs(self.disk_dir, exist_ok=True)
+            with open(os.path.join(self.disk_dir, NAMESPACE_MARKER), "w", encoding="utf-8") as f:
+                f.write(kind)
+            self._prune_namespaces(disk_dir)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    # entries written under an older configuration are never read again. a folder without the marker
+    # of this kind is not ours
+    def _prune_namespaces(self, root):
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if path == self.disk_dir or not os.path.isdir(path):
+                continue
+            try:
+                with open(os.path.join(path, NAMESPACE_MARKER), encoding="utf-8") as f:
+                    if f.read().strip() != self.kind:
+                        continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    # None for a key that is not a content key - it must never point outside the namespace folder
+    def _disk_path(self, key):
+        if not isinstance(key, str) or not DISK_KEY.fullmatch(key):
+            return None
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _store_mem(self, key, value, expires):
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        if len(value) > self.max_bytes:
+            return
+        self._mem[key] = (expires, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes and self._mem:
+            _, (_, v) = self._mem.popitem(last=False)
+            self._bytes -= len(v)
+            self.counters["evictions"] += 1
+
+    # count_miss=False is used for the exact lookup when a perceptual lookup follows it, the caller then
+    # counts the one miss of the whole lookup with miss() if the perceptual key cannot be looked up
+    def get(self, key, count_miss=True):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            aliased = key in self._alias
+            key = self._alias.get(key, key)
+            entry = self._mem.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._mem.move_to_end(key)
+                    self.counters["hits_perceptual" if aliased else "hits_memory"] += 1
+                    return entry[1]
+                self._bytes -= len(entry[1])
+                del self._mem[key]
+        value = self._get_disk(key, now)
+        with self._lock:
+            if value is None:
+                if count_miss:
+                    self.counters["misses"] += 1
+                return None
+            self.counters["hits_disk"] += 1
+            self._store_mem(key, value, now + self.ttl)
+        return value
+
+    def miss(self):
+        if self.enabled:
+            with self._lock:
+                self.counters["misses"] += 1
+
+    def _get_disk(self, key, now):
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        if path is None:
+            return None
+        try:
+            if os.path.getmtime(path) + self.ttl <= now:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    # alias - an extra key (the perceptual hash) that points to the same entry
+    def put(self, key, value: bytes, alias=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._store_mem(key, value, time.time() + self.ttl)
+            if alias:
+                self._alias[alias] = key
+                # the alias table must not grow without the entries it points to
+                if len(self._alias) > 4 * max(1, len(self._mem)):
+                    self._alias = {a: k for a, k in self._alias.items() if k in self._mem}
+            self.counters["puts"] += 1
+        path = self._disk_path(key) if self.disk_dir is not None else None
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    f.write(value)
+                os.replace(tmp, path)
+            except OSError:
+                pass
+            self._puts_since_sweep += 1
+            if self._puts_since_sweep >= 256:
+                self._puts_since_sweep = 0
+                self._sweep_disk()
+
+    # expired files are otherwise only removed when someone asks for them again
+    def _sweep_disk(self):
+        limit = time.time() - self.ttl
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name == NAMESPACE_MARKER:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) <= limit:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            hits = self.counters["hits_memory"] + self.counters["hits_disk"] + self.counters["hits_perceptual"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._mem),
+                "size_mb": round(self._bytes / (1024 * 1024), 3),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 3),
+                "disk": self.disk_dir is not None,
+                "namespace": self.namespace,
+            }
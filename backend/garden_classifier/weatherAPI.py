@@ -1,147 +1,220 @@
 import json
-from geopy.geocoders import Nominatim
+import math
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+import pytz
 from datetime import datetime, timezone, timedelta
 import openmeteo_requests
 import requests_cache
 from retry_requests import retry
 from astral import LocationInfo
-from astral.sun import sun
+from astral.sun import sun, elevation, azimuth
+import geocoding
+import metrics as M
+from forecast_cache import ForecastCache, ForecastRefresher
 
-# Computes summary features for the previous week from hourly weather data
-def compute_prev_week_features(hourly):
-    times = hourly["time"]
-    temps = hourly["temperature_2m"]
-    precs = hourly["precipitation"]
-    ws    = hourly.get("windspeed_10m", [])
-
-    # Aggregate hourly data into daily buckets
-    daily = {}
-    for i, ts in enumerate(times):
-        day = ts[:10]
-        d = daily.setdefault(day, {"temps": [], "precs": [], "winds": []})
-        d["temps"].append(temps[i])
-        d["precs"].append(precs[i])
-        if ws: d["winds"].append(ws[i])
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+# forecasts are shared by everyone inside the same grid cell (degrees), the open-meteo models have a
+# resolution of a few km so a 0.1 degree cell returns practically the same forecast
+WEATHER_GRID_DEG    = float(os.getenv("WEATHER_GRID_DEG", "0.1"))
+WEATHER_CACHE_TTL_S = float(os.getenv("WEATHER_CACHE_TTL_S", "3600"))
+WEATHER_CACHE_MAX   = int(os.getenv("WEATHER_CACHE_MAX", "4096"))
+# an expired forecast is still answered for WEATHER_STALE_S while it is refreshed in the background,
+# and cells asked for within WEATHER_ACTIVE_S are refreshed ahead of expiry (WEATHER_PREFETCH=0 turns it off)
+WEATHER_STALE_S            = float(os.getenv("WEATHER_STALE_S", "21600"))
+WEATHER_PREFETCH           = os.getenv("WEATHER_PREFETCH", "1") == "1"
+WEATHER_PREFETCH_WORKERS   = int(os.getenv("WEATHER_PREFETCH_WORKERS", "2"))
+WEATHER_PREFETCH_INTERVAL  = float(os.getenv("WEATHER_PREFETCH_INTERVAL_S", "60"))
+WEATHER_REFRESH_AHEAD      = float(os.getenv("WEATHER_REFRESH_AHEAD", "0.8"))
+WEATHER_ACTIVE_S           = float(os.getenv("WEATHER_ACTIVE_S", "86400"))
+WEATHER_PREFETCH_JITTER    = float(os.getenv("WEATHER_PREFETCH_JITTER", "0.1"))
 
-    # Get previous 7 days (excluding today)
-    today = datetime.now(timezone.utc).date()
-    prev_days = [d for d in sorted(daily.keys()) if datetime.fromisoformat(d).date() < today]
-    prev7 = prev_days[-7:]
+# the http cache below the grid cell cache must have expired by the time a cell is refreshed,
+# otherwise the refresh would just read the old response back from it
+HTTP_CACHE_S = max(1, int(WEATHER_CACHE_TTL_S * min(WEATHER_REFRESH_AHEAD, 1.0) * (1.0 - min(WEATHER_PREFETCH_JITTER, 0.9))))
+
+forecast_cache = ForecastCache(WEATHER_CACHE_TTL_S, WEATHER_CACHE_MAX, WEATHER_STALE_S, WEATHER_PREFETCH_WORKERS)
+forecast_refresher = ForecastRefresher(forecast_cache, WEATHER_PREFETCH_INTERVAL, WEATHER_REFRESH_AHEAD,
+                                       WEATHER_ACTIVE_S, WEATHER_PREFETCH_JITTER)
+
+# one open-meteo client per process - the http cache, the retry wrapper and the connection pool are
+# built once instead of on every request. the pid check rebuilds it in processes forked after import
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                cache_session = requests_cache.CachedSession('.cache', expire_after=HTTP_CACHE_S)
+                retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
+                _client = openmeteo_requests.Client(session=retry_session)
+                _client_pid = os.getpid()
+    return _client
+
+# the cell a coordinate falls in, and the coordinate of its center that is sent upstream
+def grid_cell(lat, lon, deg=WEATHER_GRID_DEG):
+    cell = (round(float(lat) / deg), round(float(lon) / deg))
+    return cell, (round(cell[0] * deg, 4), round(cell[1] * deg, 4))
+
+def weather_stats():
+    return {**forecast_cache.stats(), "geocoding": geocoding.geocode_stats(), "prefetch": WEATHER_PREFETCH, "refresher_passes": forecast_refresher.passes}
+
+### ------------------------- daily aggregation -------------------------------------- ###
+# the hourly series stay numpy arrays with the epoch start and step of the series, the day of every
+# hour is integer arithmetic on the epoch (UTC days) and every daily statistic is one reduceat over the
+# day segments. the three summaries below are all cut from this one aggregation.
+
+SECONDS_PER_DAY = 86400
+HOURLY_VARS = ["temperature_2m", "precipitation", "windspeed_10m", "uv_index"]
 
-    if not prev7:
+# UTC day number of every hour of the series (hours are consecutive so each day is one segment)
+def hour_days(hourly):
+    n = len(hourly["temperature_2m"])
+    return (int(hourly["start"]) + np.arange(n, dtype=np.int64) * int(hourly["step"])) // SECONDS_PER_DAY
+
+def today_day():
+    return int(datetime.now(timezone.utc).timestamp()) // SECONDS_PER_DAY
+
+# daily min / max / sum / count of the hourly series in one pass
+def aggregate_daily(hourly):
+    days = hour_days(hourly)
+    if len(days) == 0:
+        return {"day": days, "date": [], "count": np.zeros(0)}
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(days)) + 1))
+    temps = np.asarray(hourly["temperature_2m"], dtype=np.float64)
+    precs = np.asarray(hourly["precipitation"], dtype=np.float64)
+    out = {
+        "day": days[starts],
+        "date": [datetime.fromtimestamp(int(d) * SECONDS_PER_DAY, tz=timezone.utc).date().isoformat() for d in days[starts]],
+        "count": np.diff(np.concatenate((starts, [len(days)]))),
+        "t_min": np.minimum.reduceat(temps, starts),
+        "t_max": np.maximum.reduceat(temps, starts),
+        "t_sum": np.add.reduceat(temps, starts),
+        "p_sum": np.add.reduceat(precs, starts),
+        "w_max": None,
+        "uv_max": None,
+    }
+    ws, uvi = hourly.get("windspeed_10m"), hourly.get("uv_index")
+    if ws is not None and len(ws):
+        out["w_max"] = np.maximum.reduceat(np.asarray(ws, dtype=np.float64), starts)
+    if uvi is not None and len(uvi):
+        out["uv_max"] = np.maximum.reduceat(np.asarray(uvi, dtype=np.float64), starts)
+    return out
+
+# Computes summary features for the previous week from hourly weather data
+def compute_prev_week_features(hourly, daily=None):
+    daily = aggregate_daily(hourly) if daily is None else daily
+    # Get previous 7 days (excluding today)
+    prev7 = np.flatnonzero(daily["day"] < today_day())[-7:]
+    if len(prev7) == 0:
         return None
 
-    # Calculate summary statistics
-    tmaxes, tmins = [], []
-    total_rain = 0.0
     windy_days = 0
-    for d in prev7:
-        tmaxes.append(max(daily[d]["temps"]))
-        tmins.append(min(daily[d]["temps"]))
-        total_rain += sum(daily[d]["precs"])
-        if ws and daily[d]["winds"]:
-            if max(daily[d]["winds"]) >= 35:
-                windy_days += 1
-
+    if daily["w_max"] is not None:
+        windy_days = int(np.count_nonzero(daily["w_max"][prev7] >= 35))
     return {
-        "total_rain_mm": round(total_rain, 1),
-        "avg_tmax_c": round(sum(tmaxes) / len(tmaxes), 1),
-        "avg_tmin_c": round(sum(tmins) / len(tmins), 1),
+        "total_rain_mm": round(float(daily["p_sum"][prev7].sum()), 1),
+        "avg_tmax_c": round(float(daily["t_max"][prev7].mean()), 1),
+        "avg_tmin_c": round(float(daily["t_min"][prev7].mean()), 1),
         "windy_days": windy_days
     }
 
-# Geocodes a location name to latitude and longitude using Nominatim
-def get_coordinates(location_name):
-    geolocator = Nominatim(user_agent="weather_app")
-    location = geolocator.geocode(location_name, timeout=10)
-    if not location:
-        raise ValueError(f"Location '{location_name}' not found")
-    return location.latitude, location.longitude
-
 # Summarizes the next week's forecast from hourly data
-def summarize_next_week(data):
-    times = data["hourly"]["time"]
-    temps = data["hourly"]["temperature_2m"]
-    precs = data["hourly"]["precipitation"]
-    ws = data["hourly"].get("windspeed_10m", [])
-    uvi = data["hourly"].get("uv_index", [])
-
-    # Aggregate hourly data into daily buckets
-    daily = {}
-    for i, ts in enumerate(times):
-        day = ts[:10]
-        d = daily.setdefault(day, {"temps": [], "precs": [], "winds": [], "uvis": []})
-        d["temps"].append(temps[i])
-        d["precs"].append(precs[i])
-        if ws: d["winds"].append(ws[i])
-        if uvi: d["uvis"].append(uvi[i])
-
-    # Build daily summaries for the next 7 days
-    today_ymd = datetime.now(timezone.utc).date().isoformat()
+def summarize_next_week(data, daily=None):
+    daily = aggregate_daily(data["hourly"]) if daily is None else daily
     out = []
-    for day in sorted(daily.keys()):
-        if day < today_ymd:
-            continue
-        v = daily[day]
-        tmin = min(v["temps"])
-        tmax = max(v["temps"])
-        rain = sum(v["precs"])
+    for i in np.flatnonzero(daily["day"] >= today_day())[:7]:
         rec = {
-            "date": day,
-            "t_min_c": round(tmin, 1),
-            "t_max_c": round(tmax, 1),
-            "rain_mm": round(rain, 1)
+            "date": daily["date"][i],
+            "t_min_c": round(float(daily["t_min"][i]), 1),
+            "t_max_c": round(float(daily["t_max"][i]), 1),
+            "rain_mm": round(float(daily["p_sum"][i]), 1)
         }
-        if v["winds"]:
-            rec["max_wind_kph"] = round(max(v["winds"]), 1)
-        if v["uvis"]:
-            rec["uv_index_max"] = round(max(v["uvis"]), 1)
+        if daily["w_max"] is not None:
+            rec["max_wind_kph"] = round(float(daily["w_max"][i]), 1)
+        if daily["uv_max"] is not None:
+            rec["uv_index_max"] = round(float(daily["uv_max"][i]), 1)
         out.append(rec)
-    return out[:7]
+    return out
 
-# Fetches weather forecast data from Open-Meteo API for given coordinates
+# Summarizes hourly forecast data into daily averages and totals
+def summarize_forecast(data, daily=None):
+    daily = aggregate_daily(data["hourly"]) if daily is None else daily
+    return [{
+        "date": daily["date"][i],
+        "avg_temperature": float(daily["t_sum"][i] / daily["count"][i]),
+        "total_precipitation": float(daily["p_sum"][i])
+    } for i in range(len(daily["date"]))]
+
+# the hourly block of the json output - one ISO time string per hour and plain lists
+def hourly_as_lists(hourly):
+    n = len(hourly["temperature_2m"])
+    epochs = int(hourly["start"]) + np.arange(n, dtype=np.int64) * int(hourly["step"])
+    times = np.datetime_as_string(epochs.astype("datetime64[s]"), unit="s")
+    out = {"time": [t + "+00:00" for t in times.tolist()]}
+    for var in HOURLY_VARS:
+        if var in hourly:
+            out[var] = np.asarray(hourly[var]).tolist()
+    return out
+
+# Geocodes a location name to latitude and longitude using Nominatim (cached and rate limited, see geocoding.py)
+def get_coordinates(location_name):
+    return geocoding.geocode(location_name)
+
+# Geocodes a list of location names, {name: (lat, lon) or None}
+def get_coordinates_many(location_names):
+    return geocoding.geocode_many(location_names)
+
+# Fetches weather forecast data for given coordinates - served from the grid cell cache when possible.
+# the returned dict is shared between requests of the same cell and must not be modified
 def get_weather_forecast(lat, lon):
-    cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-    openmeteo = openmeteo_requests.Client(session=retry_session)
+    cell, (c_lat, c_lon) = grid_cell(lat, lon)
+    if WEATHER_PREFETCH:
+        forecast_refresher.ensure_running()
+    return forecast_cache.get_or_fetch(cell, lambda: fetch_weather_forecast(c_lat, c_lon))
 
-    url = "https://api.open-meteo.com/v1/forecast"
+# Fetches weather forecast data from Open-Meteo API for given coordinates
+def fetch_weather_forecast(lat, lon):
+    openmeteo = get_client()
+
+    url = OPEN_METEO_URL
     params = {
         "latitude": float(lat),
         "longitude": float(lon),
-        "hourly": ["temperature_2m", "precipitation", "windspeed_10m", "uv_index"],
+        "hourly": HOURLY_VARS,
         "timezone": "auto",
         "forecast_days": 7,
         "past_days": 7
     }
 
-    responses = openmeteo.weather_api(url, params=params)
+    with M.stage("openmeteo_fetch"):
+        responses = openmeteo.weather_api(url, params=params)
     response = responses[0]
 
     tz = response.Timezone() or "UTC"
     timezone_str = str(tz, 'utf-8') if isinstance(tz, bytes) else tz
+    # the flatbuffers strings come back as bytes, they are decoded here once instead of walking the output
+    tz_abbr = response.TimezoneAbbreviation()
+    tz_abbr = tz_abbr.decode("utf-8", "replace") if isinstance(tz_abbr, bytes) else tz_abbr
 
-    # Build hourly arrays manually from API response
-    t0 = response.Hourly().Time()
-    t1 = response.Hourly().TimeEnd()
-    step = response.Hourly().Interval()
-    times = []
-    t = t0
-    while t < t1:
-        times.append(datetime.fromtimestamp(t, tz=timezone.utc).isoformat())
-        t += step
-
+    # the hourly series stay numpy arrays, the time axis is only the epoch start and step.
+    # they are shared through the forecast cache so they are made read only
     hourly = response.Hourly()
-    out_hourly = {
-        "time": times,
-        "temperature_2m": hourly.Variables(0).ValuesAsNumpy().tolist(),
-        "precipitation":  hourly.Variables(1).ValuesAsNumpy().tolist(),
-        "windspeed_10m":  hourly.Variables(2).ValuesAsNumpy().tolist(),
-        "uv_index":       hourly.Variables(3).ValuesAsNumpy().tolist()
-    }
+    out_hourly = {"start": int(hourly.Time()), "step": int(hourly.Interval())}
+    for i, var in enumerate(HOURLY_VARS):
+        values = hourly.Variables(i).ValuesAsNumpy()
+        values.flags.writeable = False
+        out_hourly[var] = values
 
     # Calculate sun position data for the next days
-    sun_data = calculate_sun_position(float(lat), float(lon), timezone_str, 6)
+    with M.stage("sun"):
+        sun_data = calculate_sun_position(float(lat), float(lon), timezone_str, 6)
 
     return {
         "coordinates": {
@@ -149,93 +222,188 @@ def get_weather_forecast(lat, lon):
             "longitude": response.Longitude(),
             "elevation": response.Elevation(),
             "timezone": timezone_str,
-            "timezone_abbreviation": response.TimezoneAbbreviation(),
+            "timezone_abbreviation": tz_abbr,
             "utc_offset_seconds": response.UtcOffsetSeconds()
         },
         "hourly": out_hourly,
         "daily": sun_data
     }
 
-# Calculates sun position and daylight info for a location for several days
-def calculate_sun_position(lat, lon, timezone_str, days=6):
-    import pytz
-    sun_data = []
+### ------------------------- sun / daylight -------------------------------------- ###
+# sun data only depends on the place and the date, the days are memoized per
+# (rounded lat, rounded lon, timezone, date). past dates are dropped so entries expire per day,
+# and a precomputed table for a region (see precompute_daylight_table) turns the trigonometry into a lookup
+
+SUN_ROUND_DIGITS = int(os.getenv("SUN_ROUND_DIGITS", "2"))     # ~1 km, sunrise moves by seconds
+SUN_CACHE_MAX    = int(os.getenv("SUN_CACHE_MAX", "20000"))
+SUN_TABLE_PATH   = os.getenv("SUN_TABLE_PATH", "")
+
+_sun_lock = threading.Lock()
+_sun_cache = OrderedDict()     # (lat, lon, tz, date iso) -> day record, LRU
+_sun_table = {}                # keys on the table grid, loaded / precomputed - not evicted by the LRU
+_sun_table_step = None         # grid of the table in degrees, a multiple of the rounding resolution
+_sun_cache_day = None
+
+@lru_cache(maxsize=256)
+def _tz(timezone_str):
+    try:
+        return pytz.timezone(timezone_str)
+    except Exception:
+        return pytz.UTC
+
+def _sun_key(lat, lon, timezone_str, date):
+    return (round(float(lat), SUN_ROUND_DIGITS), round(float(lon), SUN_ROUND_DIGITS), timezone_str, date.isoformat())
+
+def _snap(v, step):
+    return round(round(float(v) / step) * step, SUN_ROUND_DIGITS)
+
+# a table coarser than the rounding answers for its nearest grid point (at most step/2 away)
+def _table_key(key):
+    step = _sun_table_step
+    if step is None:
+        return key
+    return (_snap(key[0], step), _snap(key[1], step), key[2], key[3])
+
+# the sun record of one day at one place
+def sun_day(lat, lon, timezone_str, date):
+    timezone_obj = _tz(timezone_str)
     try:
-        timezone_obj = pytz.timezone(timezone_str)
+        location = LocationInfo(
+            name="CustomLocation",
+            region="Region",
+            timezone=timezone_str,
+            latitude=lat,
+            longitude=lon
+        )
+        s = sun(location.observer, date=date)
+        utc = pytz.UTC
+        local_sunrise = s["sunrise"].replace(tzinfo=utc).astimezone(timezone_obj)
+        local_sunset  = s["sunset"].replace(tzinfo=utc).astimezone(timezone_obj)
+        local_noon    = s["noon"].replace(tzinfo=utc).astimezone(timezone_obj)
+        daylight_seconds = (local_sunset - local_sunrise).total_seconds()
+        daylight_hours = int(daylight_seconds // 3600)
+        daylight_minutes = int((daylight_seconds % 3600) // 60)
+        sunshine_seconds = daylight_seconds * 0.7
+        sunshine_hours = int(sunshine_seconds // 3600)
+        sunshine_minutes = int((sunshine_seconds % 3600) // 60)
+        noon_elevation = elevation(observer=location.observer, dateandtime=s["noon"])
+        noon_azimuth = azimuth(observer=location.observer, dateandtime=s["noon"])
+        return {
+            "date": date.strftime("%Y-%m-%d"),
+            "sunrise": local_sunrise.strftime("%H:%M:%S"),
+            "sunset": local_sunset.strftime("%H:%M:%S"),
+            "solar_noon": local_noon.strftime("%H:%M:%S"),
+            "daylight_duration": f"{daylight_hours}h {daylight_minutes}m",
+            "sunshine_duration": f"{sunshine_hours}h {sunshine_minutes}m",
+            "solar_elevation_noon": f"{noon_elevation:.1f}°",
+            "solar_azimuth_noon": f"{noon_azimuth:.1f}°"
+        }
     except Exception:
-        timezone_obj = pytz.UTC
-    location = LocationInfo(
-        name="CustomLocation",
-        region="Region",
-        timezone=timezone_str,
-        latitude=lat,
-        longitude=lon
-    )
+        return {
+            "date": date.strftime("%Y-%m-%d"),
+            "sunrise": None,
+            "sunset": None,
+            "solar_noon": None,
+            "daylight_duration": None,
+            "sunshine_duration": None,
+            "solar_elevation_noon": None,
+            "solar_azimuth_noon": None
+        }
+
+# day granularity expiry - once the date changes every entry of an earlier date goes
+def _expire_sun_entries(today):
+    global _sun_cache_day
+    if _sun_cache_day == today:
+        return
+    _sun_cache_day = today
+    cutoff = today.isoformat()
+    for store in (_sun_cache, _sun_table):
+        for key in [k for k in store if k[3] < cutoff]:
+            del store[key]
+
+def sun_day_cached(lat, lon, timezone_str, date):
+    key = _sun_key(lat, lon, timezone_str, date)
+    with _sun_lock:
+        rec = _sun_table.get(_table_key(key)) or _sun_cache.get(key)
+        if rec is not None:
+            if key in _sun_cache:
+                _sun_cache.move_to_end(key)
+            return rec
+    # computed from the rounded location so every caller of the key gets the same record
+    rec = sun_day(key[0], key[1], timezone_str, date)
+    with _sun_lock:
+        _sun_cache[key] = rec
+        while len(_sun_cache) > SUN_CACHE_MAX:
+            _sun_cache.popitem(last=False)
+    return rec
+
+# Calculates sun position and daylight info for a location for several days
+def calculate_sun_position(lat, lon, timezone_str, days=6):
     current_date = datetime.now().date()
-    for i in range(days):
-        date = current_date + timedelta(days=i)
-        try:
-            s = sun(location.observer, date=date)
-            utc = pytz.UTC
-            local_sunrise = s["sunrise"].replace(tzinfo=utc).astimezone(timezone_obj)
-            local_sunset  = s["sunset"].replace(tzinfo=utc).astimezone(timezone_obj)
-            local_noon    = s["noon"].replace(tzinfo=utc).astimezone(timezone_obj)
-            daylight_seconds = (local_sunset - local_sunrise).total_seconds()
-            daylight_hours = int(daylight_seconds // 3600)
-            daylight_minutes = int((daylight_seconds % 3600) // 60)
-            sunshine_seconds = daylight_seconds * 0.7
-            sunshine_hours = int(sunshine_seconds // 3600)
-            sunshine_minutes = int((sunshine_seconds % 3600) // 60)
-            from astral.sun import elevation, azimuth
-            noon_elevation = elevation(observer=location.observer, dateandtime=s["noon"])
-            noon_azimuth = azimuth(observer=location.observer, dateandtime=s["noon"])
-            sun_data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "sunrise": local_sunrise.strftime("%H:%M:%S"),
-                "sunset": local_sunset.strftime("%H:%M:%S"),
-                "solar_noon": local_noon.strftime("%H:%M:%S"),
-                "daylight_duration": f"{daylight_hours}h {daylight_minutes}m",
-                "sunshine_duration": f"{sunshine_hours}h {sunshine_minutes}m",
-                "solar_elevation_noon": f"{noon_elevation:.1f}°",
-                "solar_azimuth_noon": f"{noon_azimuth:.1f}°"
-            })
-        except Exception:
-            sun_data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "sunrise": None,
-                "sunset": None,
-                "solar_noon": None,
-                "daylight_duration": None,
-                "sunshine_duration": None,
-                "solar_elevation_noon": None,
-                "solar_azimuth_noon": None
-            })
-    return sun_data
+    with _sun_lock:
+        _expire_sun_entries(current_date)
+    return [sun_day_cached(lat, lon, timezone_str, current_date + timedelta(days=i)) for i in range(days)]
 
-# Summarizes hourly forecast data into daily averages and totals
-def summarize_forecast(data):
-    time_list = data["hourly"]["time"]
-    temps = data["hourly"]["temperature_2m"]
-    precs = data["hourly"]["precipitation"]
-
-    daily_summary = {}
-    for i, timestamp in enumerate(time_list):
-        dt = datetime.fromisoformat(timestamp)
-        day = dt.date().isoformat()
-        d = daily_summary.setdefault(day, {"temps": [], "precs": []})
-        d["temps"].append(temps[i])
-        d["precs"].append(precs[i])
-
-    summarized = []
-    for day, v in daily_summary.items():
-        avg_temp = sum(v["temps"]) / len(v["temps"])
-        total_prec = sum(v["precs"])
-        summarized.append({
-            "date": day,
-            "avg_temperature": avg_temp,
-            "total_precipitation": total_prec
-        })
-    return summarized
+# the step rounded to a multiple of the rounding resolution (default: the resolution itself)
+def _table_step(step):
+    res = 10 ** -SUN_ROUND_DIGITS
+    return round(max(1, round((step or res) / res)) * res, SUN_ROUND_DIGITS)
+
+# grid points (multiples of step) covering [lo, hi]
+def _grid(lo, hi, step):
+    return [round(k * step, SUN_ROUND_DIGITS) for k in range(math.floor(lo / step), math.ceil(hi / step) + 1)]
+
+# fills the lookup table for every grid point of a region (step in degrees, default the rounding
+# resolution) for the next days. lookups are snapped to the same grid, so a coarser step keeps the table
+# small and still answers every location of the region. the table can be saved and loaded again at
+# startup with SUN_TABLE_PATH
+def precompute_daylight_table(lat_min, lat_max, lon_min, lon_max, timezone_str, days=6, step=None):
+    global _sun_table_step
+    step = _table_step(step)
+    current_date = datetime.now().date()
+    table = {}
+    for lat in _grid(lat_min, lat_max, step):
+        for lon in _grid(lon_min, lon_max, step):
+            for i in range(days):
+                date = current_date + timedelta(days=i)
+                key = _sun_key(lat, lon, timezone_str, date)
+                table[key] = sun_day(key[0], key[1], timezone_str, date)
+    with _sun_lock:
+        _expire_sun_entries(current_date)
+        # keys of another grid would never be looked up again
+        if _sun_table_step != step:
+            _sun_table.clear()
+            _sun_table_step = step
+        _sun_table.update(table)
+    return len(table)
+
+def save_daylight_table(path):
+    with _sun_lock:
+        rows = [[*k, v] for k, v in _sun_table.items()]
+        step = _sun_table_step
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"step": step, "rows": rows}, f, separators=(",", ":"))
+
+def load_daylight_table(path):
+    global _sun_table_step
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    # a plain list of rows is a table at the rounding resolution
+    rows = data["rows"] if isinstance(data, dict) else data
+    step = _table_step(data.get("step") if isinstance(data, dict) else None)
+    today = datetime.now().date()
+    with _sun_lock:
+        _expire_sun_entries(today)
+        if _sun_table_step != step:
+            _sun_table.clear()
+            _sun_table_step = step
+        for lat, lon, tz, date, rec in rows:
+            if date >= today.isoformat():
+                _sun_table[(lat, lon, tz, date)] = rec
+    return len(_sun_table)
+
+if SUN_TABLE_PATH and os.path.exists(SUN_TABLE_PATH):
+    load_daylight_table(SUN_TABLE_PATH)
 
 # Recursively converts bytes objects to strings in nested data structures
 def convert_bytes(obj):
@@ -250,24 +418,89 @@ def convert_bytes(obj):
         return [convert_bytes(v) for v in obj]
     return obj
 
-# Main entry point: gets weather data for a location and returns a JSON summary
-def start(location_name, flag):
+# the hourly block of the compact output - columnar arrays with the epoch start and step instead of
+# one time string per hour, hour i is at start + i * step
+def hourly_columnar(hourly):
+    out = {"start": int(hourly["start"]), "step": int(hourly["step"])}
+    for var in HOURLY_VARS:
+        if var in hourly:
+            out[var] = np.round(np.asarray(hourly[var], dtype=np.float64), 2).tolist()
+    return out
+
+# the sections of the /weather output
+WEATHER_SECTIONS = ("coordinates", "hourly", "daily_sun_data", "daily_summary", "weekly_outlook", "prev_week_features")
+# what compact mode returns when no fields are given - the sections the LLM weather tool reads
+COMPACT_SECTIONS = ("weekly_outlook", "prev_week_features")
+
+# Main entry point: gets weather data for a location and returns a JSON summary.
+# fields / compact select the sections (see WEATHER_SECTIONS) and switch to the lean output - only the
+# selected sections are computed, hourly data is columnar and the json has no indentation.
+# without them the output is the full legacy document
+def start(location_name, flag, fields=None, compact=False):
     if flag != 0:
-        lat, lon = get_coordinates(location_name)
+        with M.stage("geocode"):
+            lat, lon = get_coordinates(location_name)
     else:
         lat, lon = location_name.split(",")
-    forecast_data = get_weather_forecast(lat, lon)
-    summarized = summarize_forecast(forecast_data)
-    weekly_outlook = summarize_next_week(forecast_data)
-    prev_week_features = compute_prev_week_features(forecast_data["hourly"])
-
-    output = {
-        "coordinates": forecast_data["coordinates"],
-        "hourly": forecast_data["hourly"],
-        "daily_sun_data": forecast_data["daily"],
-        "daily_summary": summarized,
-        "weekly_outlook": weekly_outlook,
-        "prev_week_features": prev_week_features
-    }
-    safe_output = convert_bytes(output)
-    return json.dumps(safe_output, indent=4)
+    with M.stage("forecast"):
+        forecast_data = get_weather_forecast(lat, lon)
+
+    if fields or compact:
+        fields = [f for f in (fields or COMPACT_SECTIONS) if f in WEATHER_SECTIONS]
+        daily = None
+        if {"daily_summary", "weekly_outlook", "prev_week_features"} & set(fields):
+            with M.stage("aggregate_daily"):
+                daily = aggregate_daily(forecast_data["hourly"])
+        build = {
+            "coordinates":        lambda: forecast_data["coordinates"],
+            "hourly":             lambda: hourly_columnar(forecast_data["hourly"]),
+            "daily_sun_data":     lambda: forecast_data["daily"],
+            "daily_summary":      lambda: summarize_forecast(forecast_data, daily),
+            "weekly_outlook":     lambda: summarize_next_week(forecast_data, daily),
+            "prev_week_features": lambda: compute_prev_week_features(forecast_data["hourly"], daily),
+        }
+        out = {}
+        for f in fields:
+            with M.stage(f):
+                out[f] = build[f]()
+        with M.stage("weather_serialize"):
+            return json.dumps(out, separators=(",", ":"))
+
+    # one aggregation for the three summaries
+    with M.stage("aggregate_daily"):
+        daily = aggregate_daily(forecast_data["hourly"])
+    with M.stage("daily_summary"):
+        summarized = summarize_forecast(forecast_data, daily)
+    with M.stage("weekly_outlook"):
+        weekly_outlook = summarize_next_week(forecast_data, daily)
+    with M.stage("prev_week_features"):
+        prev_week_features = compute_prev_week_features(forecast_data["hourly"], daily)
+
+    with M.stage("weather_serialize"):
+        output = {
+            "coordinates": forecast_data["coordinates"],
+            "hourly": hourly_as_lists(forecast_data["hourly"]),
+            "daily_sun_data": forecast_data["daily"],
+            "daily_summary": summarized,
+            "weekly_outlook": weekly_outlook,
+            "prev_week_features": prev_week_features
+        }
+        safe_output = convert_bytes(output)
+        return json.dumps(safe_output, indent=4)
+
+# building a daylight table for a region ahead of time. --step 0.05 (~5 km) keeps the file at 1/25 of
+# the 0.01 rounding grid, every lookup uses the nearest table point:
+#   python weatherAPI.py --sun-table sun_il.json --lat 29.4 33.4 --lon 34.2 35.9 --tz Asia/Jerusalem --step 0.05
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Precompute the daylight table of a region")
+    ap.add_argument("--sun-table", required=True, help="output json, load it with SUN_TABLE_PATH")
+    ap.add_argument("--lat", type=float, nargs=2, required=True, metavar=("MIN", "MAX"))
+    ap.add_argument("--lon", type=float, nargs=2, required=True, metavar=("MIN", "MAX"))
+    ap.add_argument("--tz", required=True)
+    ap.add_argument("--days", type=int, default=14)
+    ap.add_argument("--step", type=float, default=None, help="grid in degrees, default the SUN_ROUND_DIGITS resolution")
+    args = ap.parse_args()
+    n = precompute_daylight_table(*args.lat, *args.lon, args.tz, args.days, args.step)
+    save_daylight_table(args.sun_table)
+    print(f"{n} day records written to {args.sun_table}")
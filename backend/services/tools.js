@@ -81,11 +81,11 @@ const tools = {
         return { error: "lat and lon are required numbers" };
       }
 
-      // Make POST request to weather service
+      // Make POST request to weather service (compact - only the sections pickWeatherSummary reads)
       const resp = await fetch(WEATHER_BASE, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ latitude: latNum, longitude: lonNum })
+        body: JSON.stringify({ latitude: latNum, longitude: lonNum, compact: true })
       });
 
       // Handle non-OK responses
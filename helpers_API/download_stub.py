@@ -0,0 +1,83 @@
+# download_stub.py
+# a local image host for trying the downloader without the network.
+# GET /img/<n>.jpg returns a deterministic jpeg-sized payload for n, every --dup-every'th image repeats an
+# earlier one (to exercise the checksum dedupe). --fail-rate answers 500 at random, --max-rps answers
+# 429 with a Retry-After when the server is asked too fast, GET /stats returns the counters.
+#
+# usage:
+#   python download_stub.py --port 8099 --fail-rate 0.1 --max-rps 50
+#   then download http://127.0.0.1:8099/img/0.jpg ... with Downloader
+
+import argparse, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+stats = {"requests": 0, "ok": 0, "failed": 0, "rate_limited": 0}
+lock = threading.Lock()
+window = []
+
+def payload(n, size):
+    rng = random.Random(n)
+    return b"\xff\xd8\xff\xe0" + bytes(rng.getrandbits(8) for _ in range(size)) + b"\xff\xd9"
+
+class Handler(BaseHTTPRequestHandler):
+    args = None
+
+    def log_message(self, *a):
+        pass
+
+    def send(self, code, body, ctype="image/jpeg", headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with lock:
+                return self.send(200, json.dumps(stats).encode(), "application/json")
+        a = self.args
+        now = time.time()
+        with lock:
+            stats["requests"] += 1
+            window.append(now)
+            while window and window[0] < now - 1.0:
+                window.pop(0)
+            too_fast = a.max_rps and len(window) > a.max_rps
+            if too_fast:
+                stats["rate_limited"] += 1
+        if too_fast:
+            return self.send(429, b"slow down", "text/plain", {"Retry-After": "1"})
+        if a.delay:
+            time.sleep(a.delay)
+        if random.random() < a.fail_rate:
+            with lock:
+                stats["failed"] += 1
+            return self.send(500, b"stub failure", "text/plain")
+        try:
+            n = int(self.path.rsplit("/", 1)[-1].split(".")[0])
+        except ValueError:
+            return self.send(404, b"not found", "text/plain")
+        if a.dup_every and n % a.dup_every == a.dup_every - 1:
+            n -= 1
+        with lock:
+            stats["ok"] += 1
+        self.send(200, payload(n, a.size))
+
+def main():
+    ap = argparse.ArgumentParser(description="Local image host for testing downloader.py")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--size", type=int, default=200_000, help="bytes per image")
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--max-rps", type=int, default=0, help="0 = no rate limit")
+    ap.add_argument("--delay", type=float, default=0.0)
+    ap.add_argument("--dup-every", type=int, default=0)
+    Handler.args = ap.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", Handler.args.port), Handler)
+    print(f"image stub on http://127.0.0.1:{Handler.args.port}/img/<n>.jpg")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
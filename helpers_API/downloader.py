@@ -0,0 +1,211 @@
+# downloader.py
+# the image downloader shared by the helpers_API scripts.
+#  - one requests session with a connection pool, so connections are reused between images
+#  - bounded concurrency in total (workers) and per host (per_host), plus an optional request rate per host
+#  - images are streamed to disk in chunks and hashed while they are written
+#  - retries with exponential backoff (a body that breaks off halfway included), 429/503 answers pause
+#    that host for their Retry-After
+#  - a manifest (jsonl: id, url, status, bytes, sha256) - a run that is interrupted skips everything that
+#    is already done when it starts again, and images with the same checksum are only kept once
+#
+# usage:
+#   dl = Downloader("out_dir", workers=16, per_host=4)
+#   summary = dl.download_all([(id, url, "file.jpg"), ...])
+
+import os, json, time, random, hashlib, threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK = 64 * 1024
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class Downloader:
+    def __init__(self, out_dir, manifest=None, workers=16, per_host=4, host_rate=None, retries=4,
+                 backoff=0.5, timeout=30, dedupe=True, user_agent="garden-dataset-downloader/1.0"):
+        self.out_dir = str(out_dir)
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.manifest_path = manifest or os.path.join(self.out_dir, "manifest.jsonl")
+        self.workers = max(1, int(workers))
+        self.per_host = max(1, int(per_host))
+        self.host_rate = dict(host_rate or {})    # host -> requests per second
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.timeout = timeout
+        self.dedupe = dedupe
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=64, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = user_agent
+
+        self._lock = threading.Lock()
+        self._host_sem = {}
+        self._host_next = {}     # host -> earliest time of the next request (rate and Retry-After)
+        self.done = {}           # id -> manifest record
+        self.by_checksum = {}    # sha256 -> id of the kept file
+        self._load_manifest()
+
+    ### ---- manifest ---- ###
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue   # a line cut off by an interrupted run
+                self.done[rec["id"]] = rec
+        for rec in self.done.values():
+            if rec["status"] == "ok":
+                self.by_checksum.setdefault(rec["sha256"], rec["id"])
+
+    def _record(self, rec):
+        line = json.dumps(rec, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.done[rec["id"]] = rec
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    # finished in an earlier run - downloaded and still on disk, or a known duplicate
+    def is_done(self, item_id):
+        rec = self.done.get(item_id)
+        if rec is None:
+            return False
+        if rec["status"] == "ok":
+            return os.path.exists(os.path.join(self.out_dir, rec["file"]))
+        return rec["status"] == "duplicate"
+
+    ### ---- per host limits ---- ###
+    def _host(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_sem:
+                self._host_sem[host] = threading.BoundedSemaphore(self.per_host)
+            return host, self._host_sem[host]
+
+    # waits for the rate slot of the host, a Retry-After pause counts as well
+    def _pace(self, host):
+        rate = self.host_rate.get(host)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                at = self._host_next.get(host, 0.0)
+                if at <= now:
+                    if rate:
+                        self._host_next[host] = now + 1.0 / rate
+                    return
+            time.sleep(at - now)
+
+    def _pause_host(self, host, seconds):
+        with self._lock:
+            self._host_next[host] = max(self._host_next.get(host, 0.0), time.monotonic() + seconds)
+
+    @staticmethod
+    def _retry_after(resp):
+        value = resp.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+
+    # one GET with the host limits, retries and backoff, returns read(resp) of the open response
+    # (stream=True). reading the body is part of the attempt - the host slot stays taken until it is read,
+    # so per_host bounds the downloads in flight, and a body that breaks off (connection reset,
+    # ChunkedEncodingError, ReadTimeout) is retried like a failed request. read must start over on
+    # every call. an HTTPError raised by read (raise_for_status on a 404) is final
+    def fetch(self, url, read, **kwargs):
+        host, sem = self._host(url)
+        last = None
+        for attempt in range(self.retries + 1):
+            with sem:
+                self._pace(host)
+                try:
+                    with self.session.get(url, stream=True, timeout=self.timeout, **kwargs) as resp:
+                        if resp.status_code not in RETRY_STATUS:
+                            return read(resp)
+                        last = requests.HTTPError(f"{resp.status_code} for {url}", response=resp)
+                        wait = self._retry_after(resp)
+                    if wait is not None:
+                        self._pause_host(host, wait)
+                except requests.HTTPError:
+                    raise
+                except requests.RequestException as e:
+                    last = e
+            if attempt < self.retries:
+                time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+        raise last
+
+    @staticmethod
+    def _read_json(resp):
+        resp.raise_for_status()
+        return resp.json()
+
+    def get_json(self, url, **kwargs):
+        return self.fetch(url, self._read_json, **kwargs)
+
+    ### ---- downloads ---- ###
+    def download_one(self, item_id, url, filename):
+        if self.is_done(item_id):
+            return self.done[item_id]["status"]
+        path = os.path.join(self.out_dir, filename)
+        tmp = f"{path}.part"
+        rec = {"id": item_id, "url": url, "file": filename}
+
+        # every attempt writes the .part file and the hash from the start
+        def read(resp):
+            resp.raise_for_status()
+            h, size = hashlib.sha256(), 0
+            with open(tmp, "wb") as f:
+                for chunk in resp.iter_content(CHUNK):
+                    f.write(chunk)
+                    h.update(chunk)
+                    size += len(chunk)
+            return h.hexdigest(), size
+
+        try:
+            digest, size = self.fetch(url, read)
+            with self._lock:
+                kept = self.by_checksum.get(digest) if self.dedupe else None
+                if kept is None:
+                    self.by_checksum[digest] = item_id
+            if kept is not None and kept != item_id:
+                os.remove(tmp)
+                rec.update(status="duplicate", bytes=size, sha256=digest, dup_of=kept)
+            else:
+                os.replace(tmp, path)
+                rec.update(status="ok", bytes=size, sha256=digest)
+        except Exception as e:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            rec.update(status="failed", error=str(e)[:200])
+        self._record(rec)
+        return rec["status"]
+
+    # tasks - iterable of (id, url, filename), returns the count of every status
+    def download_all(self, tasks, progress_every=500):
+        summary = Counter()
+        todo = []
+        for item_id, url, filename in tasks:
+            if self.is_done(item_id):
+                summary["skipped"] += 1
+            else:
+                todo.append((item_id, url, filename))
+        t0 = time.time()
+        with ThreadPoolExecutor(self.workers) as ex:
+            for i, status in enumerate(ex.map(lambda t: self.download_one(*t), todo), 1):
+                summary[status] += 1
+                if progress_every and i % progress_every == 0:
+                    print(f"{i}/{len(todo)} ({i / (time.time() - t0):.1f}/s) {dict(summary)}")
+        return summary
@@ -2,8 +2,9 @@
 # Downloads images from Open Images where any class name contains your search term
 # Saves only JPGs - no labels are written
 
-import os, csv, io, gzip, argparse, urllib.request, pathlib
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os, csv, gzip, json, hashlib, argparse, urllib.request, pathlib
+
+from downloader import Downloader
 
 BASE = "https://storage.googleapis.com/openimages/annotations/v7"
 CLASS_CSV = "https://storage.googleapis.com/openimages/2018_04/class-descriptions-boxable.csv"
@@ -34,83 +35,136 @@ def find_mids(term, name_to_mid):
     term = term.lower()
     return {mid for name, mid in name_to_mid.items() if term in name.lower()}
 
-def stream_gz(path_gz):
-    with open(path_gz, "rb") as fh:
-        gz = gzip.GzipFile(fileobj=io.BytesIO(fh.read()))
-        yield from csv.DictReader(io.TextIOWrapper(gz, encoding="utf-8"))
+# the annotation files are read as a stream - gzip decompresses chunk by chunk and only the needed
+# columns are cut out of each line, so memory does not grow with the size of the split.
+# the ids and MIDs never contain commas or quotes, a plain split is enough for them. the columns
+# stay bytes, only the matching rows are decoded
+def stream_columns(path_gz, columns, start=0):
+    with gzip.open(path_gz, "rb") as gz:
+        header = gz.readline().decode("utf-8").rstrip("\r\n").split(",")
+        idx = [header.index(c) for c in columns]
+        n = max(idx) + 1
+        offset = gz.tell()
+        if start > offset:
+            gz.seek(start)  # forward seek - decompresses without parsing
+            offset = start
+        for line in gz:
+            offset += len(line)
+            parts = line.split(b",", n)
+            yield offset, [parts[i] for i in idx]
+
+# a scan is resumable - every SCAN_CHECKPOINT_BYTES of decompressed csv the position and the ids found so
+# far are written next to the annotations. an interrupted run continues from there, a finished scan is
+# reused as is by the next run with the same classes and cap
+SCAN_CHECKPOINT_BYTES = 256 * 1024 * 1024
+
+def scan_state_path(boxes_gz, mids, cap_per_mid):
+    st = os.stat(boxes_gz)
+    tag = f"{boxes_gz}|{st.st_size}|{int(st.st_mtime)}|{sorted(mids)}|{cap_per_mid}"
+    return f"{boxes_gz}.scan-{hashlib.sha1(tag.encode()).hexdigest()[:12]}.json"
+
+def load_scan_state(path, mids):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            st = json.load(f)
+        return st["offset"], st["counts"], set(st["keep"]), st["done"]
+    return 0, {m: 0 for m in mids}, set(), False
+
+def save_scan_state(path, offset, counts, keep, done):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"offset": offset, "counts": counts, "keep": sorted(keep), "done": done}, f)
+    os.replace(tmp, path)
 
 def collect_image_ids(split, mids, cap_per_mid=None):
     boxes_gz = f"oidv7-{split}-annotations-bbox.csv.gz"
     fetch(SPLIT[f"{split}_boxes"], boxes_gz)
-    counts = {m: 0 for m in mids}
-    keep = set()
-    for row in stream_gz(boxes_gz):
-        m = row["LabelName"]
-        if m in mids:
+    state = scan_state_path(boxes_gz, mids, cap_per_mid)
+    offset, counts, keep, done = load_scan_state(state, mids)
+    if done:
+        return keep
+    if offset:
+        print(f"Resuming the scan of {boxes_gz} at {offset / 1e6:.0f} MB")
+    next_save = offset + SCAN_CHECKPOINT_BYTES
+    wanted = {m.encode("ascii"): m for m in mids}
+    for offset, (mb, iid) in stream_columns(boxes_gz, ("LabelName", "ImageID"), offset):
+        m = wanted.get(mb)
+        if m is not None:
             if cap_per_mid is None or counts[m] < cap_per_mid:
-                keep.add(row["ImageID"])
+                keep.add(iid.decode("ascii"))
                 counts[m] += 1
+        if offset >= next_save:
+            save_scan_state(state, offset, counts, keep, False)
+            next_save = offset + SCAN_CHECKPOINT_BYTES
+    save_scan_state(state, offset, counts, keep, True)
     return keep
 
-def load_urls(split):
+# only the wanted ids are kept - the id is the first column, the full csv parse (titles may hold
+# quoted commas) runs only on the lines of wanted images
+def load_urls(split, wanted=None):
     meta_csv = f"oidv7-{split}-images-with-labels-with-rotation.csv"
     fetch(SPLIT[f"{split}_meta"], meta_csv)
     id2url = {}
     with open(meta_csv, newline="", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            u = row.get("OriginalURL") or ""
+        header = next(csv.reader(f))
+        id_col, url_col = header.index("ImageID"), header.index("OriginalURL")
+        if wanted is None:
+            rows = csv.reader(f)
+        else:
+            rows = (next(csv.reader([line])) for line in f if line.split(",", 1)[0] in wanted)
+        for row in rows:
+            u = row[url_col] if len(row) > url_col else ""
             if u:
-                id2url[row["ImageID"]] = u
+                id2url[row[id_col]] = u
     return id2url
 
 def sanitize(s):
     keep = "-_.() abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
     return "".join(c if c in keep else "_" for c in s)[:120]
 
-def download_one(iid, url, out_dir, timeout=30):
-    out = out_dir / f"{sanitize(iid)}.jpg"
-    if out.exists():
-        return True
-    try:
-        with urllib.request.urlopen(url, timeout=timeout) as r, open(out, "wb") as f:
-            f.write(r.read())
-        return True
-    except Exception:
-        return False
-
 def main():
     ap = argparse.ArgumentParser(description="Grab pixels only from Open Images by label substring")
-    ap.add_argument("--term", required=True, help="substring like 'pot' or 'plant'")
+    ap.add_argument("--term", required=True, nargs="+", help="one or more substrings like 'pot' or 'plant'")
     ap.add_argument("--split", choices=["train","val","test"], default="train")
     ap.add_argument("--out", default="oi_pixels")
     ap.add_argument("--limit-per-class", type=int, default=None, help="max images per matched class")
     ap.add_argument("--max-workers", type=int, default=16)
+    ap.add_argument("--per-host", type=int, default=8, help="concurrent downloads per image host")
+    ap.add_argument("--index", default=None, help="sqlite index from oi_index.py build, skips the csv scan")
     args = ap.parse_args()
 
-    out_dir = pathlib.Path(args.out) / f"{args.term}_{args.split}"
+    terms = " ".join(args.term)
+    out_dir = pathlib.Path(args.out) / f"{sanitize('_'.join(args.term))}_{args.split}"
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    name_to_mid = load_class_map()
-    mids = find_mids(args.term, name_to_mid)
-    if not mids:
-        print(f"No classes matched '{args.term}'")
-        return
-
-    print(f"Matched {len(mids)} classes for '{args.term}'")
-    img_ids = collect_image_ids(args.split, mids, args.limit_per_class)
-    print(f"Found {len(img_ids)} image ids in {args.split}")
-
-    id2url = load_urls(args.split)
-    tasks = [(iid, id2url[iid]) for iid in img_ids if iid in id2url]
-    print(f"{len(tasks)} have OriginalURL")
-
-    ok = 0
-    with ThreadPoolExecutor(max_workers=args.max_workers) as ex:
-        futs = [ex.submit(download_one, iid, url, out_dir) for iid, url in tasks]
-        for fut in as_completed(futs):
-            ok += 1 if fut.result() else 0
-    print(f"Downloaded {ok}/{len(tasks)} to {out_dir}")
+    if args.index:
+        import oi_index
+        conn = oi_index.connect(args.index)
+        mids = oi_index.find_mids(conn, args.term)
+        if not mids:
+            print(f"No classes matched '{terms}'")
+            return
+        print(f"Matched {len(mids)} classes for '{terms}'")
+        tasks = oi_index.query(conn, mids, args.split, args.limit_per_class)
+        print(f"{len(tasks)} images with OriginalURL in {args.split} (index)")
+    else:
+        name_to_mid = load_class_map()
+        mids = set().union(*(find_mids(t, name_to_mid) for t in args.term))
+        if not mids:
+            print(f"No classes matched '{terms}'")
+            return
+
+        print(f"Matched {len(mids)} classes for '{terms}'")
+        img_ids = collect_image_ids(args.split, mids, args.limit_per_class)
+        print(f"Found {len(img_ids)} image ids in {args.split}")
+
+        id2url = load_urls(args.split, img_ids)
+        tasks = [(iid, id2url[iid]) for iid in img_ids if iid in id2url]
+        print(f"{len(tasks)} have OriginalURL")
+
+    dl = Downloader(out_dir, workers=args.max_workers, per_host=args.per_host)
+    summary = dl.download_all((iid, url, f"{sanitize(iid)}.jpg") for iid, url in tasks)
+    print(f"Downloaded {summary['ok']}/{len(tasks)} to {out_dir} {dict(summary)}")
 
 if __name__ == "__main__":
     main()
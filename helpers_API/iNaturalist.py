@@ -1,38 +1,38 @@
-import requests
 import os
-import time  # To add a delay and avoid rate limits
+from downloader import Downloader
 
 TAXON_ID = "54919"  # Replace with your flower's taxon ID
 SAVE_DIR = "Cucumber"
 TOTAL_IMAGES = 200  # Total images needed
 IMAGES_PER_PAGE = 100  # Max images per request
 PAGES = TOTAL_IMAGES // IMAGES_PER_PAGE  # Number of pages needed
+API_RATE = 1.0  # iNaturalist asks for at most ~1 API request per second
 
 # Create directory
 os.makedirs(SAVE_DIR, exist_ok=True)
 
+# the api calls and the image downloads share the downloader - the api host is paced at API_RATE
+# (and pauses on a 429 Retry-After) instead of sleeping a fixed minute between pages
+dl = Downloader(SAVE_DIR, workers=8, per_host=4, host_rate={"api.inaturalist.org": API_RATE})
+
+tasks = []
 for page in range(1, PAGES + 1):
     API_URL = f"https://api.inaturalist.org/v1/observations?taxon_id={TAXON_ID}&per_page={IMAGES_PER_PAGE}&page={page}&order_by=random"
 
-    response = requests.get(API_URL).json()
+    response = dl.get_json(API_URL)
 
     if "results" not in response or not response["results"]:
         print(f"No more results found at page {page}. Stopping.")
-        break  # Stop if the re are no more pages
+        break  # Stop if there are no more pages
 
-    # Download images from each observation
-    for i, obs in enumerate(response["results"]):
+    # one image per observation, keyed by the photo id so a rerun skips what is already downloaded
+    for obs in response["results"]:
         if "photos" in obs and obs["photos"]:
-            img_url = obs["photos"][0]["url"].replace("square", "original")  # Get high-res image
-            img_path = f"{SAVE_DIR}/{TAXON_ID}_page{page}_img{i}.jpg"
-            
-            img_data = requests.get(img_url).content
-            with open(img_path, "wb") as f:
-                f.write(img_data)
-            
-            print(f"Downloaded {img_path}")
-
-    print(f"Sleeping for 1 minute before the next request... 💤")
-    time.sleep(60)  # Sleep for 60 seconds
-
-print("✅ Download completed!")
+            photo = obs["photos"][0]
+            img_url = photo["url"].replace("square", "original")  # Get high-res image
+            tasks.append((str(photo["id"]), img_url, f"{TAXON_ID}_{photo['id']}.jpg"))
+
+    print(f"Page {page}: {len(tasks)} images queued")
+
+summary = dl.download_all(tasks, progress_every=50)
+print(f"✅ Download completed! {dict(summary)}")
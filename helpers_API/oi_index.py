@@ -0,0 +1,165 @@
+# oi_index.py
+# a one-time sqlite index of the Open Images box annotations, so term queries do not rescan the csv.
+# build it once per split, every later query (any number of terms) reads image ids and urls from it:
+#
+#   python oi_index.py build --splits train val test
+#   python oi_index.py query --term pot plant --split train --limit-per-class 500
+#   python first_model_extracter.py --term pot "raised bed" --index oi_index.sqlite
+#
+# tables:
+#   classes(mid, name)                       - the boxable class map
+#   labels(mid, split, image_id, n_boxes)    - one row per class and image, keyed by mid
+#   urls(split, image_id, url)               - OriginalURL of the images that have boxes
+#   splits(split, source, built_at)          - which splits are indexed and from which file
+
+import os, csv, time, sqlite3, argparse
+from collections import Counter
+
+from first_model_extracter import SPLIT, fetch, load_class_map, stream_columns
+
+DEFAULT_DB = "oi_index.sqlite"
+BATCH_LINES = 500_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classes (mid TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS labels (
+    mid TEXT NOT NULL, split TEXT NOT NULL, image_id TEXT NOT NULL, n_boxes INTEGER NOT NULL,
+    PRIMARY KEY (mid, split, image_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS urls (
+    split TEXT NOT NULL, image_id TEXT NOT NULL, url TEXT NOT NULL,
+    PRIMARY KEY (split, image_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS splits (split TEXT PRIMARY KEY, source TEXT NOT NULL, built_at REAL NOT NULL);
+"""
+
+def connect(db_path=DEFAULT_DB):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def file_sig(path):
+    st = os.stat(path)
+    return f"{os.path.basename(path)}|{st.st_size}|{int(st.st_mtime)}"
+
+def index_classes(conn):
+    name_to_mid = load_class_map()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO classes (mid, name) VALUES (?, ?)",
+                         [(mid, name) for name, mid in name_to_mid.items()])
+
+def flush_labels(conn, split, counts):
+    conn.executemany(
+        "INSERT INTO labels (mid, split, image_id, n_boxes) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (mid, split, image_id) DO UPDATE SET n_boxes = n_boxes + excluded.n_boxes",
+        [(m.decode("ascii"), split, iid.decode("ascii"), n) for (m, iid), n in counts.items()])
+    counts.clear()
+
+# the box file is streamed once - (class, image) pairs are counted per batch of lines and upserted,
+# so memory stays at one batch whatever the size of the split
+def index_split(conn, split, force=False):
+    boxes_gz = f"oidv7-{split}-annotations-bbox.csv.gz"
+    fetch(SPLIT[f"{split}_boxes"], boxes_gz)
+    sig = file_sig(boxes_gz)
+    row = conn.execute("SELECT source FROM splits WHERE split = ?", (split,)).fetchone()
+    if row and row[0] == sig and not force:
+        print(f"{split}: already indexed")
+        return
+
+    t0 = time.time()
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    with conn:
+        conn.execute("DELETE FROM splits WHERE split = ?", (split,))
+        conn.execute("DELETE FROM labels WHERE split = ?", (split,))
+        conn.execute("DELETE FROM urls WHERE split = ?", (split,))
+        counts = Counter()
+        lines = 0
+        for _, (m, iid) in stream_columns(boxes_gz, ("LabelName", "ImageID")):
+            counts[m, iid] += 1
+            lines += 1
+            if lines % BATCH_LINES == 0:
+                flush_labels(conn, split, counts)
+        flush_labels(conn, split, counts)
+    print(f"{split}: {lines} boxes indexed in {time.time() - t0:.0f}s")
+
+    # urls only for the images that have boxes in this split
+    meta_csv = f"oidv7-{split}-images-with-labels-with-rotation.csv"
+    fetch(SPLIT[f"{split}_meta"], meta_csv)
+    with conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS boxed (image_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("DELETE FROM boxed")
+        conn.execute("INSERT OR IGNORE INTO boxed SELECT image_id FROM labels WHERE split = ?", (split,))
+        with open(meta_csv, newline="", encoding="utf-8") as f:
+            r = csv.reader(f)
+            header = next(r)
+            id_col, url_col = header.index("ImageID"), header.index("OriginalURL")
+            rows = ((split, row[id_col], row[url_col]) for row in r if len(row) > url_col and row[url_col])
+            conn.executemany("INSERT OR REPLACE INTO urls (split, image_id, url) "
+                             "SELECT ?, image_id, ? FROM boxed WHERE image_id = ?",
+                             ((s, u, i) for s, i, u in rows))
+        conn.execute("INSERT INTO splits (split, source, built_at) VALUES (?, ?, ?)", (split, sig, time.time()))
+    print(f"{split}: urls indexed, {time.time() - t0:.0f}s total")
+
+def build(db_path, splits, force=False):
+    conn = connect(db_path)
+    index_classes(conn)
+    for split in splits:
+        index_split(conn, split, force)
+    conn.execute("PRAGMA optimize")
+    conn.close()
+
+def is_indexed(conn, split):
+    return conn.execute("SELECT 1 FROM splits WHERE split = ?", (split,)).fetchone() is not None
+
+# class MIDs whose name contains any of the terms (case insensitive), {mid: name}
+def find_mids(conn, terms):
+    out = {}
+    for term in terms:
+        for mid, name in conn.execute("SELECT mid, name FROM classes WHERE instr(lower(name), lower(?)) > 0", (term,)):
+            out[mid] = name
+    return out
+
+# (image_id, url) of the images of the matched classes - at most limit_per_class images per class,
+# an image that belongs to several matched classes is returned once
+def query(conn, mids, split, limit_per_class=None):
+    if not is_indexed(conn, split):
+        raise RuntimeError(f"split '{split}' is not indexed, run: python oi_index.py build --splits {split}")
+    seen = {}
+    sql = ("SELECT l.image_id, u.url FROM labels l JOIN urls u ON u.split = l.split AND u.image_id = l.image_id "
+           "WHERE l.mid = ? AND l.split = ? ORDER BY l.image_id")
+    for mid in sorted(mids):
+        params = (mid, split)
+        q = sql
+        if limit_per_class is not None:
+            q += " LIMIT ?"
+            params += (limit_per_class,)
+        for iid, url in conn.execute(q, params):
+            seen.setdefault(iid, url)
+    return list(seen.items())
+
+def main():
+    ap = argparse.ArgumentParser(description="sqlite index of the Open Images box annotations")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="index one or more splits (downloads the annotation files)")
+    b.add_argument("--splits", nargs="+", choices=["train", "val", "test"], default=["train"])
+    b.add_argument("--db", default=DEFAULT_DB)
+    b.add_argument("--force", action="store_true", help="rebuild splits that are already indexed")
+    q = sub.add_parser("query", help="count the images of one or more terms")
+    q.add_argument("--term", nargs="+", required=True)
+    q.add_argument("--split", choices=["train", "val", "test"], default="train")
+    q.add_argument("--limit-per-class", type=int, default=None)
+    q.add_argument("--db", default=DEFAULT_DB)
+    args = ap.parse_args()
+
+    if args.cmd == "build":
+        build(args.db, args.splits, args.force)
+        return
+    conn = connect(args.db)
+    t0 = time.time()
+    mids = find_mids(conn, args.term)
+    for mid, name in sorted(mids.items(), key=lambda x: x[1]):
+        print(f"{mid}  {name}")
+    tasks = query(conn, mids, args.split, args.limit_per_class)
+    print(f"{len(mids)} classes, {len(tasks)} images with OriginalURL in {args.split} ({time.time() - t0:.2f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# preprocess.py
+# turns a folder of downloaded images into training-ready shards, run it after the download scripts.
+#   1. check  - every file is decoded at 1/8 scale by a process pool: unreadable or truncated files are
+#               dropped and a 64 bit difference hash is computed from the small image
+#   2. dedupe - images whose hashes differ in at most --max-distance bits are near duplicates, the
+#               first one (by file name) is kept
+#   3. shard  - the kept images are decoded at full size, letterboxed to --imgsz and written by the
+#               pool straight into memory-mappable uint8 .npy shards of --shard-size images
+# index.json lists every kept image with its shard, row, original size, scale and padding (to map boxes
+# into the letterboxed frame), and the dropped files with the reason.
+#
+# usage:
+#   python preprocess.py --src Cucumber --out Cucumber_640 --imgsz 640 --workers 8
+#   x = np.load("Cucumber_640/shard_00000.npy", mmap_mode="r")    # (n, 640, 640, 3) BGR uint8
+
+import os, json, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+IMAGE_EXT = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+PAD_VALUE = 114
+
+def list_images(src):
+    out = []
+    for root, _, files in os.walk(src):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXT:
+                out.append(os.path.join(root, name))
+    return sorted(out)
+
+# a jpeg that was cut off during the download has no end-of-image marker, opencv would decode it
+# anyway and fill the missing part with gray
+def truncated(data, path):
+    if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg"):
+        return not data.rstrip(b"\0").endswith(b"\xff\xd9")
+    return False
+
+def dhash(gray):
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+# stage 1 (worker) - path -> (path, hash or None, reason)
+def check_one(path):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return path, None, f"unreadable: {e}"
+    if not data:
+        return path, None, "empty"
+    if truncated(data, path):
+        return path, None, "truncated"
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if gray is None or gray.size == 0:
+        return path, None, "not decodable"
+    return path, dhash(gray), None
+
+# near duplicates - the 64 bits are cut into max_distance+1 bands, two hashes within max_distance bits
+# agree on at least one whole band, so only images that share a band are compared
+def dedupe(items, max_distance):
+    if max_distance < 0:
+        return items, []
+    bands = max_distance + 1
+    width = 64 // bands
+    masks = [(((1 << width) - 1) << (i * width), i) for i in range(bands)]
+    buckets = {}
+    kept, dropped = [], []
+    for path, h in items:
+        dup = None
+        for mask, i in masks:
+            for other_path, other in buckets.get((i, h & mask), ()):
+                if bin(h ^ other).count("1") <= max_distance:
+                    dup = other_path
+                    break
+            if dup:
+                break
+        if dup:
+            dropped.append((path, f"near duplicate of {os.path.basename(dup)}"))
+            continue
+        kept.append((path, h))
+        for mask, i in masks:
+            buckets.setdefault((i, h & mask), []).append((path, h))
+    return kept, dropped
+
+def letterbox(img, size):
+    h, w = img.shape[:2]
+    scale = min(size / h, size / w)
+    nw, nh = max(1, round(w * scale)), max(1, round(h * scale))
+    resized = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    out = np.full((size, size, 3), PAD_VALUE, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    out[top:top + nh, left:left + nw] = resized
+    return out, scale, left, top
+
+# stage 3 (worker) - decodes, letterboxes and writes one chunk of images into its rows of a shard
+def write_chunk(shard_path, first_row, paths, size):
+    shard = np.load(shard_path, mmap_mode="r+")
+    meta = []
+    for row, path in enumerate(paths, first_row):
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            meta.append(None)
+            continue
+        boxed, scale, left, top = letterbox(img, size)
+        shard[row] = boxed
+        meta.append({"row": row, "orig_wh": [img.shape[1], img.shape[0]], "scale": round(scale, 6), "pad": [left, top]})
+    shard.flush()
+    del shard
+    return meta
+
+def main():
+    ap = argparse.ArgumentParser(description="Validate, dedupe, letterbox and shard downloaded images")
+    ap.add_argument("--src", required=True)
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--shard-size", type=int, default=1024, help="images per shard")
+    ap.add_argument("--max-distance", type=int, default=4, help="dhash bits for a near duplicate, -1 keeps all")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--chunk", type=int, default=32, help="images per worker task when writing")
+    args = ap.parse_args()
+
+    paths = list_images(args.src)
+    if not paths:
+        print(f"No images found in {args.src}")
+        return
+    os.makedirs(args.out, exist_ok=True)
+    workers = max(1, args.workers)
+    t_start = time.time()
+
+    with ProcessPoolExecutor(workers) as ex:
+        t0 = time.time()
+        checked = list(ex.map(check_one, paths, chunksize=16))
+        t_check = time.time() - t0
+        dropped = [(p, reason) for p, h, reason in checked if h is None]
+        kept, dups = dedupe([(p, h) for p, h, _ in checked if h is not None], args.max_distance)
+        dropped += dups
+
+        t0 = time.time()
+        shards, futs = [], []
+        for s, start in enumerate(range(0, len(kept), args.shard_size)):
+            part = kept[start:start + args.shard_size]
+            shard_path = os.path.join(args.out, f"shard_{s:05d}.npy")
+            np.lib.format.open_memmap(shard_path, mode="w+", dtype=np.uint8,
+                                      shape=(len(part), args.imgsz, args.imgsz, 3)).flush()
+            shards.append((shard_path, part))
+            for c in range(0, len(part), args.chunk):
+                paths_c = [p for p, _ in part[c:c + args.chunk]]
+                futs.append((s, c, ex.submit(write_chunk, shard_path, c, paths_c, args.imgsz)))
+        index = []
+        for s, c, fut in futs:
+            part = shards[s][1]
+            for (path, h), meta in zip(part[c:c + args.chunk], fut.result()):
+                if meta is None:
+                    dropped.append((path, "not decodable"))
+                    continue
+                index.append({"file": os.path.relpath(path, args.src), "shard": os.path.basename(shards[s][0]),
+                              **meta, "dhash": f"{h:016x}"})
+        t_write = time.time() - t0
+
+    total = time.time() - t_start
+    with open(os.path.join(args.out, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({"imgsz": args.imgsz, "pad_value": PAD_VALUE, "color": "BGR", "images": index,
+                   "dropped": [{"file": os.path.relpath(p, args.src), "reason": r} for p, r in dropped]}, f, indent=1)
+
+    n = len(paths)
+    print(f"{n} files: {len(index)} kept in {len(shards)} shards, {len(dropped)} dropped")
+    print(f"check  {n / t_check:.1f} images/s ({n / t_check / workers:.1f} per core)")
+    if kept:
+        print(f"shard  {len(kept) / t_write:.1f} images/s ({len(kept) / t_write / workers:.1f} per core)")
+    print(f"total  {n / total:.1f} images/s with {workers} workers")
+
+if __name__ == "__main__":
+    main()